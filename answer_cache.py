@@ -0,0 +1,111 @@
+# answer_cache.py
+import base64
+import re
+import threading
+import time
+import numpy as np
+from disk_cache import DiskCache, hash_key
+from tracing import span
+
+# Cosine similarity above which two questions count as the same question. Kept high on
+# purpose: a false hit answers a different question with full confidence
+SIMILARITY_THRESHOLD = 0.93
+ANSWER_TTL = 7 * 24 * 60 * 60
+# Answers kept per prescription/web context; the oldest are dropped first
+MAX_ANSWERS_PER_CONTEXT = 200
+
+
+# Openings and words that lean on earlier turns ("what are its side effects?", "and the
+# second one?"). Such a question means something else in another conversation, so it is
+# never served from or stored in the cache; a false match here only costs a miss
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(and|also|so|then|what about|how about)\b"
+    r"|\b(it|its|it's|this|that|these|those|they|them|their|one|ones|same|above|previous|else)\b",
+    re.IGNORECASE,
+)
+
+
+def is_follow_up(question):
+    return bool(FOLLOW_UP_PATTERN.search(question))
+
+
+def context_fingerprint(prescription_text, web_info=None):
+    # The same question only has the same answer against the same prescription and web passages
+    parts = [prescription_text or ""]
+    for item in web_info or []:
+        parts.extend([item["url"], item["text"]])
+    return hash_key(*parts)
+
+
+def _encode_vector(vector):
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vectors(entries):
+    return np.stack([np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float32) for entry in entries])
+
+
+class AnswerCache:
+    """Answers to earlier questions, found by question similarity.
+
+    Entries are grouped by context fingerprint (see context_fingerprint), so
+    a hit can only come from a question asked against the same prescription
+    and web context. Each entry holds the English answer, its Hindi
+    translation, the audio file and the sources shown with it. A lookup
+    costs one query embedding and a dot product over the context's entries.
+    The groups live in a DiskCache, so they are shared by every worker
+    process and bounded by its LRU eviction.
+    """
+
+    def __init__(self, embed_query, threshold=SIMILARITY_THRESHOLD, ttl=ANSWER_TTL,
+                 max_entries=MAX_ANSWERS_PER_CONTEXT, cache=None):
+        self.embed_query = embed_query
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache = cache or DiskCache("answers", max_bytes=50 * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def _fresh_entries(self, fingerprint):
+        entries = self.cache.get_json(fingerprint) or []
+        now = time.time()
+        return [entry for entry in entries if now - entry["stored_at"] <= self.ttl]
+
+    def lookup(self, question, fingerprint):
+        """Return (entry, question_vector); entry is None on a miss.
+
+        Pass question_vector back to store() so a miss is not embedded twice.
+        """
+        vector = np.asarray(self.embed_query(question), dtype=np.float32)
+        with span("answer_cache_lookup") as attributes:
+            entries = self._fresh_entries(fingerprint)
+            attributes["entries"] = len(entries)
+            if not entries:
+                attributes["hit"] = False
+                return None, vector
+            vectors = _decode_vectors(entries)
+            similarities = vectors @ vector / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(vector) + 1e-12)
+            best = int(np.argmax(similarities))
+            attributes["similarity"] = float(similarities[best])
+            attributes["hit"] = bool(similarities[best] >= self.threshold)
+        if similarities[best] < self.threshold:
+            return None, vector
+        return {**entries[best], "similarity": float(similarities[best])}, vector
+
+    def store(self, question, fingerprint, answer, hindi_answer, audio_file=None, sources=(), vector=None):
+        if vector is None:
+            vector = self.embed_query(question)
+        entry = {
+            "question": question,
+            "vector": _encode_vector(vector),
+            "answer": answer,
+            "hindi_answer": hindi_answer,
+            "audio_file": audio_file,
+            "sources": list(sources),
+            "stored_at": time.time(),
+        }
+        # Read-modify-write of the context's group; other processes may lose a
+        # concurrent entry, which only costs a later miss
+        with self._lock:
+            entries = self._fresh_entries(fingerprint) + [entry]
+            self.cache.set_json(fingerprint, entries[-self.max_entries:])
@@ -0,0 +1,23 @@
+# api_keys.py
+import json
+import os
+
+# Used for any key that is not set in the environment
+CREDENTIALS_FILE = os.environ.get(
+    "PRESCRIPTION_CREDENTIALS_FILE", os.path.expanduser("~/Desktop/credentials/PP/credentials.json")
+)
+
+def load_api_keys(credentials_path=CREDENTIALS_FILE):
+    """Return (openai_api_key, sarvam_api_key).
+
+    OPENAI_API_KEY and SARVAM_API_KEY win over the credentials file, so the
+    file is optional when both are set. Missing keys are returned as None.
+    """
+    credentials = {}
+    if os.path.exists(credentials_path):
+        with open(credentials_path, "r") as f:
+            credentials = json.load(f)
+    return (
+        os.environ.get("OPENAI_API_KEY", credentials.get("openai_api_key")),
+        os.environ.get("SARVAM_API_KEY", credentials.get("sarvam_api_key")),
+    )
@@ -0,0 +1,146 @@
+# batch_process.py
+# Headless batch mode: extract, translate and voice every prescription image in a directory.
+#
+# Usage: python batch_process.py path/to/images path/to/output [--openai-workers 4] [--sarvam-workers 2]
+#
+# Results are appended to <output>/results.jsonl (one line per image) and audio goes to
+# <output>/audio/. Images already listed in results.jsonl as done are skipped, so a crashed
+# run can simply be started again with the same arguments; images recorded as failed
+# (translation or TTS) are tried again and get a new line.
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from api_keys import CREDENTIALS_FILE, load_api_keys
+from disk_cache import hash_key
+from prescription_processing import TRANSLATION_FAILED, extract_prescription, translate_to_hindi, text_to_speech
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+HISTOGRAM_BUCKETS = [0.5, 1, 2, 5, 10, 20, 60]
+
+def iter_images(input_dir, done):
+    # Stream the directory instead of listing thousands of entries up front
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.name not in done:
+                yield entry.path
+
+def load_checkpoint(results_path):
+    # Images with a successful record; failed ones (including records written before
+    # failures were marked, which stored the translation failure as the Hindi text) are retried
+    done = set()
+    if os.path.exists(results_path):
+        with open(results_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record["error"] is None and record["hindi"] != TRANSLATION_FAILED:
+                        done.add(record["image"])
+                except (ValueError, KeyError):
+                    # A partially written last line from a crashed run
+                    continue
+    return done
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def print_report(stage_latencies, processed, failed, elapsed):
+    print(f"\nProcessed {processed} images ({failed} failed) in {elapsed:.1f}s: "
+          f"{processed / elapsed * 60 if elapsed else 0:.1f} images/minute")
+    for stage, latencies in stage_latencies.items():
+        if not latencies:
+            continue
+        print(f"\n{stage}: n={len(latencies)} p50={percentile(latencies, 0.5):.2f}s p95={percentile(latencies, 0.95):.2f}s")
+        lower = 0
+        for upper in HISTOGRAM_BUCKETS + [float("inf")]:
+            count = sum(1 for latency in latencies if lower <= latency < upper)
+            label = f"{lower:>4}-{upper:<4}s" if upper != float("inf") else f"{lower:>4}+     "
+            print(f"  {label} {'#' * min(count, 60)} {count}")
+            lower = upper
+
+class BatchProcessor:
+    def __init__(self, output_dir, openai_api_key, sarvam_api_key, openai_workers=4, sarvam_workers=2):
+        self.output_dir = output_dir
+        self.audio_dir = os.path.join(output_dir, "audio")
+        self.results_path = os.path.join(output_dir, "results.jsonl")
+        self.openai_api_key = openai_api_key
+        self.sarvam_api_key = sarvam_api_key
+        # Bounded concurrency per provider, independent of the number of images in flight
+        self.limits = {"openai": threading.Semaphore(openai_workers), "sarvam": threading.Semaphore(sarvam_workers)}
+        self.max_in_flight = openai_workers + sarvam_workers
+        self.stage_latencies = defaultdict(list)
+        self._write_lock = threading.Lock()
+        os.makedirs(self.audio_dir, exist_ok=True)
+
+    def _timed(self, stage, provider, fn, *args, **kwargs):
+        with self.limits[provider]:
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.stage_latencies[stage].append(time.perf_counter() - start)
+            return result
+
+    def process_image(self, image_path):
+        with open(image_path, "rb") as image_file:
+            english_text = self._timed("extract", "openai", extract_prescription, image_file, self.openai_api_key)
+        hindi_text = self._timed("translate", "sarvam", translate_to_hindi, english_text, self.sarvam_api_key)
+        record = {"image": os.path.basename(image_path), "english": english_text, "hindi": None, "audio": None}
+        if hindi_text == TRANSLATION_FAILED:
+            # Nothing to voice; the image is retried on the next run
+            record.update(status="failed", error=TRANSLATION_FAILED)
+        else:
+            record["hindi"] = hindi_text
+            audio_file = os.path.join(self.audio_dir, f"{hash_key(hindi_text)}.wav")
+            success, message = self._timed("tts", "sarvam", text_to_speech, hindi_text, self.sarvam_api_key, output_file=audio_file)
+            if success:
+                record.update(status="done", audio=os.path.relpath(audio_file, self.output_dir), error=None)
+            else:
+                record.update(status="failed", error=message)
+        with self._write_lock, open(self.results_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record["status"] == "done"
+
+    def run(self, input_dir):
+        images = iter_images(input_dir, load_checkpoint(self.results_path))
+        processed = failed = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            in_flight = {}
+            while True:
+                # Keep a bounded window of images in flight rather than queueing the whole archive
+                for image_path in images:
+                    in_flight[executor.submit(self.process_image, image_path)] = image_path
+                    if len(in_flight) >= self.max_in_flight * 2:
+                        break
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    image_path = in_flight.pop(future)
+                    processed += 1
+                    if future.exception() is not None:
+                        failed += 1
+                        print(f"Failed {image_path}: {future.exception()}")
+                    elif not future.result():
+                        failed += 1
+                        print(f"Failed {image_path}: recorded in results.jsonl, will be retried on the next run")
+        print_report(self.stage_latencies, processed, failed, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process a directory of prescription images without the UI.")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--openai-workers", type=int, default=4)
+    parser.add_argument("--sarvam-workers", type=int, default=2)
+    parser.add_argument("--credentials", default=CREDENTIALS_FILE)
+    args = parser.parse_args()
+    openai_api_key, sarvam_api_key = load_api_keys(args.credentials)
+    if not openai_api_key or not sarvam_api_key:
+        parser.error("set OPENAI_API_KEY and SARVAM_API_KEY or pass --credentials")
+    BatchProcessor(
+        args.output_dir, openai_api_key, sarvam_api_key,
+        openai_workers=args.openai_workers, sarvam_workers=args.sarvam_workers
+    ).run(args.input_dir)
@@ -0,0 +1,64 @@
+# benchmarks/bench_answer_cache.py
+# Time AnswerCache lookups (hit and miss) as the number of cached answers for one
+# prescription grows. Embeddings are stand-in unit vectors; a "paraphrase" is a stored
+# question's vector plus a little noise, so only the cache's own cost is measured
+# (a real lookup adds one query embedding call).
+#
+# Usage: python benchmarks/bench_answer_cache.py [--entries 10,50,200] [--lookups 200]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["PRESCRIPTION_CACHE_DIR"] = tempfile.mkdtemp(prefix="prescription-answer-cache-")
+import numpy as np
+from answer_cache import AnswerCache, context_fingerprint
+from disk_cache import DiskCache
+
+DIMENSIONS = 1536
+ANSWER = ("Amoxicillin 250 mg is taken three times a day for 7 days, about eight hours apart. "
+          "Finish the full course even if you feel better.") * 2
+
+def unit(vector):
+    return vector / np.linalg.norm(vector)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", default="10,50,200")
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'entries':>8} {'hit p50 (ms)':>13} {'hit p95 (ms)':>13} {'miss p50 (ms)':>14} {'hit rate':>9}")
+    for count in [int(value) for value in args.entries.split(",")]:
+        vectors = {}
+        cache = AnswerCache(lambda question: vectors[question], cache=DiskCache(f"answers-{count}"))
+        fingerprint = context_fingerprint(f"prescription {count}")
+        stored = [unit(rng.normal(size=DIMENSIONS)) for _ in range(count)]
+        for i, vector in enumerate(stored):
+            vectors[f"question {i}"] = vector
+            cache.store(f"question {i}", fingerprint, ANSWER, ANSWER, "/tmp/answer.wav", [{"text": ANSWER[:200], "source": "prescription"}])
+
+        hits, hit_times, miss_times = 0, [], []
+        for i in range(args.lookups):
+            vectors["paraphrase"] = unit(stored[i % count] + rng.normal(scale=0.006, size=DIMENSIONS))
+            vectors["unrelated"] = unit(rng.normal(size=DIMENSIONS))
+            start = time.perf_counter()
+            entry, _ = cache.lookup("paraphrase", fingerprint)
+            hit_times.append(time.perf_counter() - start)
+            hits += entry is not None
+            start = time.perf_counter()
+            cache.lookup("unrelated", fingerprint)
+            miss_times.append(time.perf_counter() - start)
+
+        print(f"{count:>8} {percentile(hit_times, 0.5) * 1000:>13.2f} {percentile(hit_times, 0.95) * 1000:>13.2f} "
+              f"{percentile(miss_times, 0.5) * 1000:>14.2f} {hits / args.lookups:>9.0%}")
+
+if __name__ == "__main__":
+    main()
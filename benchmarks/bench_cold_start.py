@@ -0,0 +1,68 @@
+# benchmarks/bench_cold_start.py
+# Measure cold start of the Streamlit app: time from a fresh interpreter to the first
+# rendered page of main.py, and which top-level imports that time goes to
+# (python -X importtime).
+#
+# Usage: python benchmarks/bench_cold_start.py [--runs 3] [--top 10]
+#
+# Each run is a new process, so nothing is shared through sys.modules or st.cache_resource.
+# API keys are set to dummy values and the cache directory is empty; no request is made
+# before the first render.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_RENDER = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+print(json.dumps({"seconds": time.perf_counter() - start, "errors": [str(e.value) for e in app.exception]}))
+"""
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package"; nesting is shown by indentation
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            imports[name.strip()] = int(cumulative) / 1e6
+    return imports
+
+def first_render(env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", FIRST_RENDER, os.path.join(APP_DIR, "main.py")],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ, OPENAI_API_KEY="offline", SARVAM_API_KEY="offline",
+               PRESCRIPTION_CACHE_DIR=tempfile.mkdtemp(prefix="prescription-cold-start-"))
+    runs = [first_render(env) for _ in range(args.runs)]
+
+    seconds = sorted(render["seconds"] for render, _ in runs)
+    print(f"First render over {args.runs} runs: min {seconds[0]:.2f}s, median {seconds[len(seconds) // 2]:.2f}s")
+    errors = runs[-1][0]["errors"]
+    if errors:
+        print(f"First render raised: {errors}")
+
+    imports = runs[-1][1]
+    print(f"\n{'top-level import':<40} {'cumulative (s)':>14}")
+    for name, cumulative in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40} {cumulative:>14.3f}")
+
+if __name__ == "__main__":
+    main()
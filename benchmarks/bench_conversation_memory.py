@@ -0,0 +1,56 @@
+# benchmarks/bench_conversation_memory.py
+# Compare prompt history size and build time over a long chat:
+# the old unbounded join versus ConversationMemory. History is built before each answer
+# (memory_ms); the summary is updated after it (compact_ms), as main.py does.
+#
+# Usage: python benchmarks/bench_conversation_memory.py [--turns 50]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conversation_memory import ConversationMemory, estimate_tokens
+
+QUESTION = "What are the side effects of Paracetamol and how often should I take it?"
+ANSWER = ("Paracetamol is usually taken every 4 to 6 hours, not more than 4 grams a day. "
+          "Common side effects are rare but can include nausea and skin rash. ") * 3
+
+def fake_summarize(summary, new_lines):
+    # Stand-in for the LLM summarizer: fixed latency, bounded output
+    time.sleep(0.05)
+    return (summary + " " + new_lines[:200])[-480:]
+
+def run(turns):
+    messages = []
+    summarizer_calls = []
+
+    def summarize(summary, new_lines):
+        summarizer_calls.append(len(messages))
+        return fake_summarize(summary, new_lines)
+
+    memory = ConversationMemory(summarize=summarize)
+    print(f"{'turn':>4} {'unbounded_tokens':>16} {'memory_tokens':>13} {'memory_ms':>9} {'compact_ms':>10}")
+    for turn in range(1, turns + 1):
+        messages.append({"role": "user", "content": QUESTION})
+        unbounded = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages[:-1])
+
+        start = time.perf_counter()
+        memory.sync(messages[:-1])
+        history = memory.history()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        messages.append({"role": "assistant", "content": ANSWER})
+        start = time.perf_counter()
+        memory.sync(messages)
+        memory.compact()
+        compact_ms = (time.perf_counter() - start) * 1000
+
+        if turn == 1 or turn % 10 == 0:
+            print(f"{turn:>4} {estimate_tokens(unbounded):>16} {estimate_tokens(history):>13} {elapsed_ms:>9.1f} {compact_ms:>10.1f}")
+    print(f"\nSummarizer calls: {len(summarizer_calls)} over {turns} turns, all after an answer")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    run(parser.parse_args().turns)
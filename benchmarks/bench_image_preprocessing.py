@@ -0,0 +1,48 @@
+# benchmarks/bench_image_preprocessing.py
+# Bytes, vision tokens and (optionally) extraction latency before and after image preprocessing.
+#
+# Usage: python benchmarks/bench_image_preprocessing.py image1.png [image2.jpg ...] [--live --runs 3]
+# --live sends both versions of each image to gpt-4o and needs OPENAI_API_KEY.
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_preprocessing import preprocess_image
+from prescription_processing import request_extraction
+
+def time_extraction(image_bytes, mime_type, api_key, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        request_extraction(image_bytes, mime_type, api_key)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+def run(paths, live, runs):
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if live and not api_key:
+        sys.exit("--live needs OPENAI_API_KEY")
+    for path in paths:
+        with open(path, "rb") as f:
+            raw_bytes = f.read()
+        start = time.perf_counter()
+        processed_bytes, mime_type, stats = preprocess_image(raw_bytes)
+        preprocess_ms = (time.perf_counter() - start) * 1000
+        print(f"{os.path.basename(path)}: {stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes, "
+              f"{stats['tokens_before']} -> {stats['tokens_after']} tokens, "
+              f"{stats['size_before']} -> {stats['size_after']}, preprocess {preprocess_ms:.0f} ms")
+        if live:
+            raw_latency = time_extraction(raw_bytes, "image/png", api_key, runs)
+            processed_latency = time_extraction(processed_bytes, mime_type, api_key, runs)
+            print(f"  extraction median over {runs} runs: raw {raw_latency:.2f}s, preprocessed {processed_latency:.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    run(args.images, args.live, args.runs)
@@ -0,0 +1,129 @@
+# benchmarks/bench_pipeline.py
+# Drive the project's provider-facing functions against local stand-ins and report
+# throughput and tail latency, without any credentials or network access.
+#
+# Usage: python benchmarks/bench_pipeline.py [--scenarios extract,answer,web,tts]
+#            [--requests 40] [--concurrency 8] [--latency openai=400,pages=1500]
+#            [--jitter pages=2000] [--error-rate sarvam=0.05]
+#
+# The "answer" scenario embeds through langchain's OpenAIEmbeddings, which tokenizes with
+# tiktoken; on a machine with no internet access point TIKTOKEN_CACHE_DIR at a directory
+# that already holds the cl100k_base file.
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_services import FakeServices
+
+SCENARIOS = ["extract", "answer", "web", "tts"]
+PRESCRIPTION_TEXT = ("Take Paracetamol 500 mg tablet twice a day after food for 5 days. "
+                     "Take Amoxicillin 250 mg capsule three times a day for 7 days.")
+
+def parse_overrides(value, cast):
+    # "openai=400,pages=1500" -> {"openai": 400.0, "pages": 1500.0}
+    overrides = {}
+    for item in filter(None, (value or "").split(",")):
+        name, number = item.split("=")
+        overrides[name.strip()] = cast(number)
+    return overrides
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def unique_png(i):
+    from PIL import Image
+    image = Image.new("RGB", (1200, 1600), (250, 250, 245))
+    image.putpixel((i % 1200, i // 1200), (0, 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def build_scenarios():
+    # Imported here, after the environment points the clients at the stand-ins
+    from prescription_processing import extract_prescription, text_to_speech
+    from rag_search import PrescriptionIndex, answer_question, setup_rag_pipeline
+    from web_search import fetch_web_info
+
+    def extract(i):
+        extract_prescription(io.BytesIO(unique_png(i)), "offline")
+
+    qa_chain = None
+
+    def answer(i):
+        nonlocal qa_chain
+        if qa_chain is None:
+            qa_chain = setup_rag_pipeline(PRESCRIPTION_TEXT, PRESCRIPTION_TEXT, PrescriptionIndex("offline"), "bench")
+        answer_question(qa_chain, f"How often do I take medicine number {i}?", "", prescription_text=PRESCRIPTION_TEXT)
+
+    def web(i):
+        results = fetch_web_info(f"side effects of medicine number {i}")
+        if results[0]["url"] == "N/A":
+            raise RuntimeError("no web results")
+
+    def tts(i):
+        success, message = text_to_speech(f"[hi] Take medicine number {i} twice a day after food.", "offline")
+        if not success:
+            raise RuntimeError(message)
+
+    return {"extract": extract, "answer": answer, "web": web, "tts": tts}
+
+def run_scenario(fn, requests, concurrency):
+    latencies = []
+    errors = 0
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            fn(i)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    # Warm-up call so one-time client construction is not counted
+    fn(requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, error in executor.map(timed, range(requests)):
+            latencies.append(latency)
+            errors += error is not None
+    return time.perf_counter() - start, latencies, errors
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", help="base latency in ms per service, e.g. openai=400,pages=1500")
+    parser.add_argument("--jitter", help="extra random latency in ms per service")
+    parser.add_argument("--error-rate", help="fraction of requests that fail per service")
+    args = parser.parse_args()
+
+    profiles = {}
+    for key, value in [("latency_ms", args.latency), ("jitter_ms", args.jitter), ("error_rate", args.error_rate)]:
+        for service, number in parse_overrides(value, float).items():
+            profiles.setdefault(service, {})[key] = number
+    fake = FakeServices(profiles).start()
+
+    # Fresh cache directory so every request takes the uncached path
+    os.environ.update(fake.environment())
+    os.environ["PRESCRIPTION_CACHE_DIR"] = tempfile.mkdtemp(prefix="prescription-bench-")
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    scenarios = build_scenarios()
+
+    print(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'req/s':>7} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'max (s)':>8}")
+    for name in args.scenarios.split(","):
+        elapsed, latencies, errors = run_scenario(scenarios[name], args.requests, args.concurrency)
+        print(f"{name:<10} {len(latencies):>8} {errors:>6} {len(latencies) / elapsed:>7.2f} "
+              f"{percentile(latencies, 0.5):>8.3f} {percentile(latencies, 0.95):>8.3f} "
+              f"{percentile(latencies, 0.99):>8.3f} {max(latencies):>8.3f}")
+    print(f"\nRequests served by the stand-ins: {fake.requests}")
+    fake.stop()
+
+if __name__ == "__main__":
+    main()
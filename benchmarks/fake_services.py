@@ -0,0 +1,270 @@
+# benchmarks/fake_services.py
+# Local stand-ins for OpenAI (chat, vision, embeddings), Sarvam (translate, TTS),
+# Google Custom Search and the result pages, with configurable latency, jitter and errors.
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+EMBEDDING_DIMENSIONS = 1536
+SAMPLE_RATE = 22050
+
+DEFAULT_PROFILES = {
+    # latency_ms is the base response time, token_ms the gap between streamed tokens
+    "openai": {"latency_ms": 400, "jitter_ms": 200, "error_rate": 0.0, "token_ms": 20},
+    "embeddings": {"latency_ms": 80, "jitter_ms": 40, "error_rate": 0.0},
+    "sarvam": {"latency_ms": 300, "jitter_ms": 150, "error_rate": 0.0},
+    "search": {"latency_ms": 250, "jitter_ms": 100, "error_rate": 0.0},
+    "pages": {"latency_ms": 500, "jitter_ms": 1500, "error_rate": 0.0},
+}
+
+ANSWER_TEXT = ("Paracetamol is taken every 4 to 6 hours after food and should not exceed 4 grams a day. "
+               "Common side effects are rare but can include nausea and rash. Please consult a healthcare professional.")
+
+PAGE_TEMPLATE = """<html><head><title>{title}</title><script>var tracking = 1;</script></head><body>
+<nav>Home | Medicines | Conditions | Login | Accept cookies to continue browsing this site</nav>
+<header>Trusted medicine information for patients and caregivers everywhere</header>
+<main>{paragraphs}</main>
+<footer>Copyright and privacy policy, terms of use, contact us, careers and advertising</footer>
+</body></html>"""
+
+DISCOVERY_DOCUMENT = {
+    "kind": "discovery#restDescription",
+    "discoveryVersion": "v1",
+    "id": "customsearch:v1",
+    "name": "customsearch",
+    "version": "v1",
+    "protocol": "rest",
+    "servicePath": "",
+    "batchPath": "batch",
+    "parameters": {"key": {"type": "string", "location": "query"}},
+    "schemas": {"Search": {"id": "Search", "type": "object"}},
+    "resources": {
+        "cse": {
+            "methods": {
+                "list": {
+                    "id": "search.cse.list",
+                    "path": "customsearch/v1",
+                    "httpMethod": "GET",
+                    "response": {"$ref": "Search"},
+                    "parameters": {
+                        "q": {"type": "string", "location": "query"},
+                        "cx": {"type": "string", "location": "query"},
+                        "num": {"type": "integer", "location": "query"},
+                    },
+                }
+            }
+        }
+    },
+}
+
+
+def fake_embedding(item):
+    # Deterministic unit vector per input (text or token ids)
+    seed = hashlib.sha256(json.dumps(item).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+def silence_base64(text):
+    # 10 ms of silence per character, roughly the length of real speech
+    return base64.b64encode(b"\x00\x00" * (SAMPLE_RATE // 100) * len(text)).decode("ascii")
+
+
+class FakeServices:
+    """Run all stand-in services on one local HTTP server.
+
+    profiles overrides DEFAULT_PROFILES per service, e.g.
+    FakeServices({"pages": {"latency_ms": 3000, "error_rate": 0.2}}).
+    Injected errors alternate between 500 and 429 with Retry-After.
+    """
+
+    def __init__(self, profiles=None, seed=0):
+        self.profiles = {name: dict(profile) for name, profile in DEFAULT_PROFILES.items()}
+        for name, overrides in (profiles or {}).items():
+            self.profiles[name].update(overrides)
+        self.requests = {name: 0 for name in self.profiles}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        services = self
+
+        class Handler(_FakeHandler):
+            fake = services
+
+        self.server = _QuietServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="fake-services").start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def environment(self):
+        # Environment variables that point the project's clients at this server
+        return {
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "OPENAI_API_BASE": f"{self.base_url}/v1",
+            "SARVAM_BASE_URL": self.base_url,
+            "GOOGLE_DISCOVERY_URL": f"{self.base_url}/discovery/{{api}}/{{apiVersion}}",
+        }
+
+    def delay(self, service):
+        profile = self.profiles[service]
+        with self._lock:
+            self.requests[service] += 1
+            jitter = self._rng.uniform(0, profile["jitter_ms"])
+            fail = self._rng.random() < profile["error_rate"]
+            status = self._rng.choice([500, 429])
+        time.sleep((profile["latency_ms"] + jitter) / 1000)
+        return status if fail else None
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients drop connections on purpose (hedged requests, deadlines); not worth a traceback
+        pass
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status):
+        self._send_json({"error": {"message": f"injected {status}"}, "message": f"injected {status}"},
+                        status=status, headers={"Retry-After": "1"} if status == 429 else None)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        request = self._read_json()
+        if path == "/v1/chat/completions":
+            self._chat(request)
+        elif path == "/v1/embeddings":
+            self._embeddings(request)
+        elif path == "/translate":
+            self._translate(request)
+        elif path == "/text-to-speech":
+            self._tts(request)
+        else:
+            self._send_error(404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/discovery/"):
+            document = dict(DISCOVERY_DOCUMENT, rootUrl=f"{self.fake.base_url}/", baseUrl=f"{self.fake.base_url}/")
+            self._send_json(document)
+        elif url.path == "/customsearch/v1":
+            self._search(parse_qs(url.query))
+        elif url.path.startswith("/pages/"):
+            self._page(url.path)
+        else:
+            self._send_error(404)
+
+    def _chat(self, request):
+        error = self.fake.delay("openai")
+        if error:
+            return self._send_error(error)
+        model = request.get("model", "gpt-4o")
+        if not request.get("stream"):
+            words = len(ANSWER_TEXT.split())
+            return self._send_json({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER_TEXT}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 500, "completion_tokens": words, "total_tokens": 500 + words},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for word in ANSWER_TEXT.split(" "):
+            chunk = {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.fake.profiles["openai"]["token_ms"] / 1000)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _embeddings(self, request):
+        error = self.fake.delay("embeddings")
+        if error:
+            return self._send_error(error)
+        inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+        self._send_json({
+            "object": "list", "model": request.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(item)} for i, item in enumerate(inputs)],
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        })
+
+    def _translate(self, request):
+        error = self.fake.delay("sarvam")
+        if error:
+            return self._send_error(error)
+        self._send_json({"translated_text": "\n".join(f"[hi] {line}" for line in request["input"].split("\n"))})
+
+    def _tts(self, request):
+        error = self.fake.delay("sarvam")
+        if error:
+            return self._send_error(error)
+        self._send_json({"audios": [silence_base64(text) for text in request["inputs"]]})
+
+    def _search(self, query):
+        error = self.fake.delay("search")
+        if error:
+            return self._send_error(error)
+        q = query.get("q", [""])[0]
+        num = int(query.get("num", ["3"])[0])
+        key = hashlib.sha256(q.encode("utf-8")).hexdigest()[:12]
+        self._send_json({"items": [{"link": f"{self.fake.base_url}/pages/{key}-{i}", "title": q} for i in range(num)]})
+
+    def _page(self, path):
+        etag = f'"{hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        error = self.fake.delay("pages")
+        if error:
+            return self._send_error(error)
+        paragraphs = "\n".join(f"<p>Section {i}: {ANSWER_TEXT}</p>" for i in range(40))
+        body = PAGE_TEMPLATE.format(title=path, paragraphs=paragraphs).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
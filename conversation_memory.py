@@ -0,0 +1,92 @@
+# conversation_memory.py
+# The summary is a small, separate completion; it does not need the answer model
+SUMMARY_MODEL = "gpt-4o-mini"
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a patient and a pharmacy assistant.
+Keep medicine names, dosages and any concerns the patient raised. Reply with the updated summary only, under {max_words} words.
+
+Current summary:
+{summary}
+
+New lines:
+{new_lines}
+"""
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English; good enough for budgeting
+    return len(text) // 4 + 1
+
+def make_llm_summarizer(llm, max_words=120):
+    def summarize(summary, new_lines):
+        prompt = SUMMARY_PROMPT.format(max_words=max_words, summary=summary or "(none)", new_lines=new_lines)
+        return llm.invoke(prompt).content.strip()
+    return summarize
+
+
+class ConversationMemory:
+    """Conversation history for prompts, bounded by a token budget.
+
+    Recent turns are kept verbatim. Once they exceed the budget, compact()
+    folds the oldest turns into a running summary with one summarizer call;
+    the summary is updated incrementally rather than recomputed from the
+    full history. Adding messages never calls the summarizer, so callers
+    run compact() after the answer has been delivered, off the path of the
+    next question. The history string is built once and reused until a new
+    message arrives.
+    """
+
+    def __init__(self, summarize=None, max_tokens=600):
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.summary = ""
+        self.recent = []
+        self.seen_messages = 0
+        self._history = None
+
+    def add(self, role, content):
+        self.recent.append(f"{role}: {content}")
+        self._history = None
+
+    def sync(self, messages):
+        # Add only the messages we have not seen yet
+        for msg in messages[self.seen_messages:]:
+            self.add(msg["role"], msg["content"])
+        self.seen_messages = max(self.seen_messages, len(messages))
+
+    def compact(self):
+        # Once over budget, fold the oldest turns until the recent window is at half
+        # the budget, so the summarizer runs once every few turns rather than every turn
+        if sum(estimate_tokens(line) for line in self.recent) <= self.max_tokens:
+            return
+        folded = []
+        remaining = list(self.recent)
+        while len(remaining) > 1 and sum(estimate_tokens(line) for line in remaining) > self.max_tokens // 2:
+            folded.append(remaining.pop(0))
+        if not folded:
+            return
+        if self.summarize:
+            # Lines are only dropped once the summary that replaces them exists
+            self.summary = self.summarize(self.summary, "\n".join(folded))
+        else:
+            # Without a summarizer, keep only as much of the old text as fits the budget
+            self.summary = (self.summary + "\n" + "\n".join(folded)).strip()[-self.max_tokens * 2:]
+        self.recent = remaining
+        self._history = None
+
+    def to_dict(self):
+        # Everything but the summarizer, for storing the session outside this process
+        return {"max_tokens": self.max_tokens, "summary": self.summary, "recent": self.recent, "seen_messages": self.seen_messages}
+
+    @classmethod
+    def from_dict(cls, data, summarize=None):
+        memory = cls(summarize=summarize, max_tokens=data["max_tokens"])
+        memory.summary = data["summary"]
+        memory.recent = list(data["recent"])
+        memory.seen_messages = data["seen_messages"]
+        return memory
+
+    def history(self):
+        if self._history is None:
+            parts = [f"Summary of earlier conversation: {self.summary}"] if self.summary else []
+            self._history = "\n".join(parts + self.recent)
+        return self._history
@@ -0,0 +1,130 @@
+# disk_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_ROOT = os.environ.get(
+    "PRESCRIPTION_CACHE_DIR", os.path.expanduser("~/.cache/prescription-chatbot")
+)
+
+
+def hash_key(*parts):
+    # Build a stable key from strings/bytes (e.g. image bytes + model + prompt)
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Small on-disk key/value store with size-bounded LRU eviction.
+
+    Each entry is one file named after the key. The file's mtime is bumped
+    on every hit, so the oldest mtime is the least recently used entry.
+    The directory may be shared by several worker processes: temp files carry
+    the pid, and sizes are re-read from disk every RESCAN_INTERVAL seconds and
+    before evicting, so entries written by other workers count toward max_bytes.
+    """
+
+    RESCAN_INTERVAL = 30
+
+    def __init__(self, name, max_bytes=100 * 1024 * 1024):
+        self.directory = os.path.join(CACHE_ROOT, name)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        # Re-read entry sizes from disk (other processes may have added or evicted files)
+        sizes = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                if entry.is_file():
+                    sizes[entry.name] = entry.stat().st_size
+            except OSError:
+                # Removed by another process mid-scan
+                pass
+        self._sizes = sizes
+        self._total = sum(sizes.values())
+        self._scanned_at = time.monotonic()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return data
+
+    def set(self, key, data):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._total += len(data) - self._sizes.get(key, 0)
+            self._sizes[key] = len(data)
+            if time.monotonic() - self._scanned_at > self.RESCAN_INTERVAL:
+                self._scan()
+            self._evict()
+
+    def get_json(self, key):
+        data = self.get(key)
+        return json.loads(data) if data is not None else None
+
+    def set_json(self, key, value):
+        self.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def get_fresh_json(self, key, ttl):
+        # mtime tracks recency of use, so expiry uses the stored_at written by set_timestamped_json
+        value = self.get_json(key)
+        if value is None or time.time() - value.get("stored_at", 0) > ttl:
+            return None
+        return value
+
+    def set_timestamped_json(self, key, value):
+        self.set_json(key, {**value, "stored_at": time.time()})
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        # Only evict against what is really on disk
+        self._scan()
+        if self._total <= self.max_bytes:
+            return
+        by_age = []
+        for key in self._sizes:
+            try:
+                by_age.append((os.path.getmtime(self._path(key)), key))
+            except OSError:
+                by_age.append((0, key))
+        by_age.sort()
+        for _, key in by_age:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._total -= self._sizes.pop(key)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._sizes), "bytes": self._total}
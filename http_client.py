@@ -0,0 +1,297 @@
+# http_client.py
+import contextvars
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from tracing import in_current_trace
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt: rate limited or a transient server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Absolute time.monotonic() by which the current user request must be answered, if any
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+# OpenAI calls go through the SDK (httpx), which retries 429/5xx with jittered backoff and
+# honours Retry-After itself; these bound it the same way as the requests-based clients
+OPENAI_TIMEOUT = 60
+OPENAI_MAX_RETRIES = 2
+
+# Second copies of slow requests run here so the caller can wait on both
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+@contextmanager
+def request_deadline(seconds):
+    """Bound every provider call made inside the block (and in worker threads
+    started from it with in_current_trace) to finish within `seconds`.
+
+    A nested deadline can only shorten the one already in force.
+    """
+    deadline = time.monotonic() + seconds
+    outer = current_deadline.get()
+    token = current_deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining_time():
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def openai_timeout():
+    # Per-attempt timeout for an OpenAI SDK call: OPENAI_TIMEOUT, or under a deadline an
+    # equal share of the time left for each attempt the SDK may make
+    remaining = remaining_time()
+    if remaining is None:
+        return OPENAI_TIMEOUT
+    if remaining <= 0:
+        raise requests.Timeout("Deadline passed before calling OpenAI")
+    return min(OPENAI_TIMEOUT, remaining / (OPENAI_MAX_RETRIES + 1))
+
+
+def is_provider_failure(error):
+    """True if an SDK error says the provider is in trouble: a connection error,
+    a timeout, 429 or 5xx. Errors caused by the request itself (a 400 for an
+    unreadable image, a prompt over the context length) are not failures."""
+    # openai.APIStatusError and googleapiclient's HttpError both carry the status
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in RETRY_STATUSES or status_code >= 500
+    transport_errors = [requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError]
+    # The SDKs are imported where first used; if one is not loaded, it did not raise this
+    openai = sys.modules.get("openai")
+    if openai is not None:
+        transport_errors.append(openai.APIConnectionError)
+    httplib2 = sys.modules.get("httplib2")
+    if httplib2 is not None:
+        transport_errors.append(httplib2.HttpLib2Error)
+    return isinstance(error, tuple(transport_errors))
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a provider that has been failing."""
+
+
+class CircuitBreaker:
+    """Stop calling a provider after repeated failures, then probe it again.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail immediately for reset_timeout seconds. The first call after that is
+    let through as a probe: success closes the circuit, failure opens it again.
+    failure_threshold=None never opens (for callers that talk to many hosts).
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        # Called once a call has finished however it ended; a probe that neither succeeded
+        # nor failed (e.g. an exception unrelated to the provider) must not keep the circuit shut
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        if self.failure_threshold is None:
+            return
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probing:
+                    logger.warning("Circuit for %s opened after %d failures", self.name, self.failures)
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    @contextmanager
+    def guard(self):
+        # For SDK calls that do their own HTTP (OpenAI): fail fast when open, count the outcome.
+        # Only provider failures count, as in ProviderClient; bad input must not open the circuit
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        try:
+            yield
+        except Exception as e:
+            if is_provider_failure(e):
+                self.record_failure()
+            raise
+        else:
+            self.record_success()
+        finally:
+            # Also covers an abandoned call (e.g. a stream the caller stopped reading)
+            self.release_probe()
+
+
+def retry_after_seconds(response):
+    # Retry-After is either a number of seconds or an HTTP date
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderClient:
+    """Pooled HTTP client for one provider.
+
+    Every request gets a timeout (shortened to the current deadline), is
+    retried with jittered exponential backoff on connection errors, timeouts
+    and RETRY_STATUSES (waiting at least Retry-After when the provider sends
+    it, unless that is longer than max_backoff or the time left before the
+    deadline), and goes through the provider's circuit breaker. With hedge_after
+    set, a request still running after that many seconds is sent a second
+    time and whichever answers first is used; only use it for idempotent
+    calls.
+
+    After the last attempt the final response is returned whatever its
+    status, so callers keep handling non-200 answers themselves.
+    """
+
+    def __init__(self, name, timeout=10, max_retries=2, backoff=0.5, max_backoff=8, hedge_after=None,
+                 pool_size=10, failure_threshold=5, reset_timeout=30, headers=None):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def available(self):
+        return not self.breaker.is_open
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        # A per-call timeout (seconds) overrides the client's
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise requests.Timeout(f"Deadline passed before calling {self.name}")
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+            attempt_timeout = timeout if remaining is None else min(timeout, remaining)
+
+            try:
+                response = self._send(method, url, attempt_timeout, **kwargs)
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                response, error = None, e
+            else:
+                if response.status_code in RETRY_STATUSES:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                    return response
+                error = None
+            finally:
+                self.breaker.release_probe()
+
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if response is not None:
+                delay = max(delay, retry_after_seconds(response) or 0)
+            remaining = remaining_time()
+            # Only a Retry-After can push the delay past max_backoff: rather than hold the
+            # caller for as long as the provider asks, hand its answer back now
+            if attempt >= self.max_retries or delay > self.max_backoff or (remaining is not None and delay >= remaining):
+                if error is not None:
+                    raise error
+                return response
+
+            logger.warning("%s %s failed (%s), retrying in %.2fs", self.name, url,
+                           error or f"status {response.status_code}", delay)
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self, method, url, timeout, **kwargs):
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return self.session.request(method, url, timeout=timeout, **kwargs)
+
+        send = in_current_trace(self.session.request)
+        first = _hedge_executor.submit(send, method, url, timeout=timeout, **kwargs)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        logger.debug("Hedging %s %s after %.2fs", self.name, url, self.hedge_after)
+        second = _hedge_executor.submit(send, method, url, timeout=timeout - self.hedge_after, **kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                # The slower copy is not needed; release its connection when it finishes
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                return response
+        raise error
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+# Shared by every OpenAI call in the process (extraction, embeddings, answers)
+openai_breaker = CircuitBreaker("openai")
@@ -0,0 +1,88 @@
+# image_preprocessing.py
+import io
+import math
+from PIL import Image, ImageOps, ImageStat
+
+# Bump when the preprocessing output changes so cached extractions are not reused
+PREPROCESS_VERSION = "1"
+
+# gpt-4o (detail=high) fits the image in 2048x2048, then scales the short side to 768
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+JPEG_QUALITY = 80
+# Deskew search range and step (degrees); phone photos are rarely more than a few degrees off
+MAX_SKEW = 5
+SKEW_STEP = 0.5
+PAPER_THRESHOLD = 200
+
+def vision_tokens(width, height):
+    """Tokens gpt-4o charges for an image at detail=high."""
+    scale = min(1.0, MAX_LONG_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, MAX_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+def _row_profile_score(image):
+    # Text lines give a spiky row profile when level: squeeze to one column (row means)
+    rows = image.resize((1, image.height), Image.BOX)
+    return ImageStat.Stat(rows).var[0]
+
+def estimate_skew(gray):
+    thumbnail = gray.copy()
+    thumbnail.thumbnail((600, 600))
+    thumbnail = ImageOps.invert(ImageOps.autocontrast(thumbnail))
+    angles = [i * SKEW_STEP for i in range(int(-MAX_SKEW / SKEW_STEP), int(MAX_SKEW / SKEW_STEP) + 1)]
+    return max(angles, key=lambda angle: _row_profile_score(thumbnail.rotate(angle, resample=Image.BILINEAR)))
+
+def crop_to_document(gray, margin=0.01):
+    # The paper is normally the brightest large region in a phone photo; keep the image if it looks wrong
+    paper = ImageOps.autocontrast(gray).point(lambda value: 255 if value > PAPER_THRESHOLD else 0)
+    box = paper.getbbox()
+    if not box:
+        return gray
+    left, top, right, bottom = box
+    if (right - left) * (bottom - top) < 0.25 * gray.width * gray.height:
+        return gray
+    pad_x, pad_y = int(gray.width * margin), int(gray.height * margin)
+    return gray.crop((max(0, left - pad_x), max(0, top - pad_y), min(gray.width, right + pad_x), min(gray.height, bottom + pad_y)))
+
+def preprocess_image(image_bytes):
+    """Shrink a prescription photo to what the vision model actually uses.
+
+    Returns (jpeg_bytes, mime_type, stats) where stats reports the bytes and
+    vision tokens before and after.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    original_size = image.size
+    image = ImageOps.exif_transpose(image)
+    gray = ImageOps.grayscale(image)
+
+    # Crop before rotating so the white fill around the rotated page is not mistaken for paper.
+    # The model rescales the short side to 768, so a crop that changes the aspect ratio can
+    # cost more tiles than it saves; only keep it when it does not
+    cropped = crop_to_document(gray)
+    if vision_tokens(*cropped.size) <= vision_tokens(*gray.size):
+        gray = cropped
+    angle = estimate_skew(gray)
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, fillcolor=255)
+
+    scale = min(1.0, MAX_LONG_SIDE / max(gray.size), MAX_SHORT_SIDE / min(gray.size))
+    if scale < 1.0:
+        gray = gray.resize((round(gray.width * scale), round(gray.height * scale)), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    gray.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    processed_bytes = buffer.getvalue()
+
+    stats = {
+        "bytes_before": len(image_bytes),
+        "bytes_after": len(processed_bytes),
+        "tokens_before": vision_tokens(*original_size),
+        "tokens_after": vision_tokens(*gray.size),
+        "skew_degrees": angle,
+        "size_before": original_size,
+        "size_after": gray.size,
+    }
+    return processed_bytes, "image/jpeg", stats
@@ -0,0 +1,40 @@
+# ingest_corpus.py
+# Build the on-disk drug monograph index that rag_search memory-maps at startup.
+#
+# Usage: python ingest_corpus.py path/to/monographs [--index-dir DIR]
+# Each .txt or .md file in the directory is one monograph; its file name is the source.
+import argparse
+import os
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from rag_search import DRUG_INDEX_DIR, build_embeddings
+
+def load_monographs(corpus_dir):
+    documents = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith((".txt", ".md")):
+            continue
+        with open(os.path.join(corpus_dir, name), "r", encoding="utf-8") as f:
+            documents.append(Document(page_content=f.read(), metadata={"source": name}))
+    return documents
+
+def build_drug_index(corpus_dir, openai_api_key, index_dir=DRUG_INDEX_DIR, chunk_size=800, chunk_overlap=100):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = splitter.split_documents(load_monographs(corpus_dir))
+    if not chunks:
+        raise ValueError(f"No .txt or .md monographs found in {corpus_dir}")
+    vector_store = FAISS.from_documents(chunks, build_embeddings(openai_api_key))
+    vector_store.save_local(index_dir)
+    return len(chunks)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk and embed a drug monograph corpus into a FAISS index.")
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--index-dir", default=DRUG_INDEX_DIR)
+    parser.add_argument("--openai-api-key", default=os.environ.get("OPENAI_API_KEY"))
+    args = parser.parse_args()
+    if not args.openai_api_key:
+        parser.error("pass --openai-api-key or set OPENAI_API_KEY")
+    count = build_drug_index(args.corpus_dir, args.openai_api_key, index_dir=args.index_dir)
+    print(f"Indexed {count} chunks into {args.index_dir}")
@@ -0,0 +1,64 @@
+# job_pipeline.py
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from tracing import in_current_trace
+
+# Shared by every job in the process
+job_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="job")
+
+
+class StagedJob:
+    """Run named stages on a thread pool as soon as their dependencies finish.
+
+    Each stage is called with the results of the stages it depends on, in
+    the order they are listed. Stages never block a worker while waiting:
+    a stage is only submitted once all of its dependencies are done. If a
+    dependency fails, the stage fails with the same exception.
+    """
+
+    def __init__(self, executor=job_executor):
+        self.executor = executor
+        self.futures = {}
+        self.timings = {}
+
+    def add_stage(self, name, fn, depends_on=()):
+        future = Future()
+        self.futures[name] = future
+        # Spans recorded by the stage belong to the trace that created the job
+        fn = in_current_trace(fn)
+        dependencies = [self.futures[dependency] for dependency in depends_on]
+        remaining = [len(dependencies)]
+        lock = threading.Lock()
+
+        def run():
+            start = time.perf_counter()
+            try:
+                future.set_result(fn(*[dependency.result() for dependency in dependencies]))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.timings[name] = time.perf_counter() - start
+
+        def on_dependency_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            for dependency in dependencies:
+                if dependency.exception() is not None:
+                    future.set_exception(dependency.exception())
+                    return
+            self.executor.submit(run)
+
+        if not dependencies:
+            self.executor.submit(run)
+        for dependency in dependencies:
+            dependency.add_done_callback(on_dependency_done)
+        return future
+
+    def result(self, name, timeout=None):
+        return self.futures[name].result(timeout)
+
+    def done(self, name):
+        return self.futures[name].done()
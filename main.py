@@ -1,26 +1,318 @@
+import http.cookies
 import os
-import json
+import logging
+import queue
+import re
+import threading
+import time
+import uuid
 import streamlit as st
-from prescription_processing import extract_prescription, translate_to_hindi, text_to_speech
-from rag_search import setup_rag_pipeline, answer_question
-from web_search import fetch_web_info
+from api_keys import load_api_keys
+from prescription_processing import TRANSLATION_FAILED, extract_prescription, translate_to_hindi, text_to_speech_stream, tts_available, tts_output_path, pcm_to_wav_bytes
+from conversation_memory import SUMMARY_MODEL, ConversationMemory, make_llm_summarizer
+from http_client import OPENAI_MAX_RETRIES, OPENAI_TIMEOUT
+from job_pipeline import StagedJob
+from session_store import SESSION_TTL, SessionArtifacts, collect_garbage, open_session_store
+from tracing import format_stage_report, spans_jsonl, start_metrics_server, start_trace
 
-# Define the path to the credentials file
-credentials_path = os.path.expanduser("~/Desktop/credentials/PP/credentials.json")
-# Load credentials
-with open(credentials_path, "r") as f:
-    credentials = json.load(f)
+# Debug output is off unless LOG_LEVEL=DEBUG is set
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING"))
+logger = logging.getLogger(__name__)
 
-SARVAM_API_KEY = credentials["sarvam_api_key"]
-OPENAI_API_KEY = credentials["openai_api_key"]
-SEARCH_ENGINE_ID = credentials.get("search_engine_id")  # Optional, use .get() to avoid KeyError if absent
+# langchain, FAISS and the Google client are imported where they are first needed
+# (upload, question or web search), so the first page renders without them.
+
+# How often each worker removes expired sessions and their artifacts (seconds)
+SESSION_GC_INTERVAL = 60 * 60
+# Cookie that carries the session id across reconnects
+SESSION_COOKIE = "prescription_session"
+# Metrics ports tried per machine, one per worker process (see get_metrics_server)
+METRICS_PORTS = int(os.environ.get("METRICS_PORTS", "16"))
+# Operators only: the per-stage latency sidebar and span download
+LATENCY_SIDEBAR = os.environ.get("LATENCY_SIDEBAR") == "1"
+
+@st.cache_resource
+def get_api_keys():
+    # (openai_api_key, sarvam_api_key), from the environment or the credentials file, read once per process
+    openai_api_key, sarvam_api_key = load_api_keys()
+    if not openai_api_key or not sarvam_api_key:
+        raise RuntimeError("Set OPENAI_API_KEY and SARVAM_API_KEY or provide a credentials file (PRESCRIPTION_CREDENTIALS_FILE)")
+    return openai_api_key, sarvam_api_key
+
+def openai_api_key():
+    return get_api_keys()[0]
+
+def sarvam_api_key():
+    return get_api_keys()[1]
+
+@st.cache_resource
+def get_prescription_index():
+    # One document index, drug corpus and set of OpenAI clients for every session in this process
+    from rag_search import PrescriptionIndex
+    return PrescriptionIndex(openai_api_key())
+
+@st.cache_resource
+def get_answer_cache():
+    # Shares the index's query embeddings, so a miss costs no extra embedding call
+    from answer_cache import AnswerCache
+    return AnswerCache(get_prescription_index().embed_query)
+
+@st.cache_resource
+def get_summarizer():
+    # Its own, cheaper model: folding history is a short summary, not an answer
+    from langchain_openai import ChatOpenAI
+    llm = ChatOpenAI(
+        model_name=SUMMARY_MODEL, openai_api_key=openai_api_key(), request_timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES
+    )
+    return make_llm_summarizer(llm)
+
+def summarize_history(summary, new_lines):
+    # The summarizer is only built once a conversation needs folding
+    return get_summarizer()(summary, new_lines)
+
+def update_conversation_memory():
+    # Called once the answer and its audio have been delivered: folding old turns into the
+    # summary costs an LLM call every few turns, and must not delay any answer
+    memory = st.session_state.memory
+    memory.sync(st.session_state.messages)
+    try:
+        memory.compact()
+    except Exception:
+        # The turns stay in the recent window and are folded after the next answer
+        logger.exception("Updating the conversation summary failed")
+
+@st.cache_resource
+def get_session_store():
+    # SESSION_STORE: a directory (default) or sqlite:///path; shared by every worker
+    return open_session_store()
+
+@st.cache_resource
+def start_session_gc():
+    # One collector thread per worker process; collections in several workers at once don't conflict
+    store = get_session_store()
+
+    def collect():
+        while True:
+            try:
+                removed = collect_garbage(store)
+                if removed:
+                    logger.info("Removed %d expired sessions", removed)
+            except Exception:
+                logger.exception("Session garbage collection failed")
+            time.sleep(SESSION_GC_INTERVAL)
+
+    thread = threading.Thread(target=collect, daemon=True, name="session-gc")
+    thread.start()
+    return thread
+
+def session_id_from_cookie():
+    # Cookies come with the websocket handshake, so one set during this connection is only
+    # seen after a reconnect, which is when it is needed. Not available outside a server
+    # (e.g. AppTest)
+    from streamlit.web.server.websocket_headers import _get_websocket_headers
+    try:
+        headers = _get_websocket_headers() or {}
+    except RuntimeError:
+        return None
+    morsel = http.cookies.SimpleCookie(headers.get("Cookie", "")).get(SESSION_COOKIE)
+    if morsel is None or not re.fullmatch(r"[0-9a-f]{32}", morsel.value):
+        return None
+    return morsel.value
+
+def set_session_cookie(session_id):
+    # Streamlit cannot set cookies from Python; the component's iframe shares the app's origin.
+    # Unlike a URL, the cookie is not handed on with a copied link
+    import streamlit.components.v1 as components
+    components.html(
+        f"""<script>
+        const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+        window.parent.document.cookie = "{SESSION_COOKIE}={session_id}; Max-Age={SESSION_TTL}; Path=/; SameSite=Strict" + secure;
+        </script>""",
+        height=0
+    )
+
+def start_new_session():
+    # Forget this conversation in the browser; the old session expires with SESSION_TTL
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    st.session_state.session_id = uuid.uuid4().hex
+    st.rerun()
+
+def session_artifacts():
+    return SessionArtifacts(st.session_state.session_id)
+
+def save_session():
+    # Everything another worker needs to carry on this conversation. The index is
+    # referenced by session_id and rebuilt from the two texts where it is missing
+    state = st.session_state
+    get_session_store().save(state.session_id, {
+        "prescription_text": state.prescription_text,
+        "hindi_text": state.hindi_text,
+        "messages": state.messages,
+        "last_question": state.last_question,
+        "last_answer_sufficient": state.last_answer_sufficient,
+        "audio_file": state.audio_file,
+        "audio_generated": state.get("audio_generated", False),
+        "memory": state.memory.to_dict(),
+    })
+
+def restore_session(saved):
+    for key in ["prescription_text", "hindi_text", "messages", "last_question", "last_answer_sufficient", "audio_file", "audio_generated"]:
+        st.session_state[key] = saved[key]
+    st.session_state.memory = ConversationMemory.from_dict(saved["memory"], summarize=summarize_history)
+
+def get_qa_chain():
+    # Built on the first question this worker sees for the session (e.g. after a reconnect
+    # to another worker), or again if the index dropped the session's documents as idle
+    if not st.session_state.prescription_text:
+        return None
+    index = get_prescription_index()
+    if st.session_state.qa_chain is None or not index.has_session(st.session_state.session_id):
+        from rag_search import restore_rag_pipeline
+        st.session_state.qa_chain = restore_rag_pipeline(
+            st.session_state.prescription_text, st.session_state.hindi_text, index, st.session_state.session_id
+        )
+    return st.session_state.qa_chain
+
+def stream_hindi_audio(hindi_text, heading):
+    # Play each chunk as soon as it is synthesized; the full WAV is kept for later reruns
+    audio_file = tts_output_path(hindi_text, directory=session_artifacts().directory)
+    st.write(heading)
+    if os.path.exists(audio_file):
+        st.audio(audio_file)
+        return audio_file
+    if not tts_available():
+        # TTS has been failing; don't make the user wait on it
+        st.info("Audio is unavailable right now, please read the text above.")
+        return None
+    try:
+        for audio_data in text_to_speech_stream(hindi_text, sarvam_api_key(), output_file=audio_file):
+            st.audio(pcm_to_wav_bytes(audio_data), format="audio/wav")
+    except RuntimeError as e:
+        st.error(str(e))
+        return None
+    return audio_file
+
+def stream_answer_into(placeholder, question, conversation_history, web_info=None):
+    # Render tokens in the assistant bubble as they arrive and record latency for the question
+    from rag_search import stream_answer
+    timings = {}
+    with placeholder.container():
+        source_documents, tokens = stream_answer(
+            get_qa_chain(),
+            question,
+            conversation_history,
+            prescription_text=st.session_state.prescription_text,
+            web_info=web_info,
+            timings=timings
+        )
+        answer = st.write_stream(tokens)
+    st.session_state.answer_timings.append({"question": question, "web": bool(web_info), **timings})
+    logger.info("Answer timings: %s", st.session_state.answer_timings[-1])
+    return answer, source_documents
+
+def show_sources(sources):
+    if sources:
+        st.write("### Sources Used")
+        for source in sources:
+            st.write(f"- {source['text']}... (Source: {source['source']})")
+
+def answer_and_speak(question, conversation_history, web_info=None, max_hindi_chars=None, use_cache=True):
+    """Answer in the chat, list the sources and play the Hindi audio; returns the answer.
+
+    A question close enough to one already answered against the same
+    prescription and web context is served from the answer cache, with no
+    LLM, translation or TTS call. Answers are cached once their audio exists.
+    Follow-up questions (see answer_cache.is_follow_up) and calls with
+    use_cache=False neither read nor write the cache.
+    """
+    from answer_cache import context_fingerprint, is_follow_up
+    answer_cache = get_answer_cache()
+    use_cache = use_cache and not is_follow_up(question)
+    fingerprint = context_fingerprint(st.session_state.prescription_text, web_info)
+    cached, question_vector = answer_cache.lookup(question, fingerprint) if use_cache else (None, None)
+    if cached:
+        logger.info("Answer cache hit for %r (similarity %.3f to %r)", question, cached["similarity"], cached["question"])
+        st.chat_message("assistant").markdown(cached["answer"])
+        show_sources(cached["sources"])
+        # Built from the TTS chunk cache (no TTS call) if this session has no copy of the audio yet
+        stream_hindi_audio(cached["hindi_answer"], "### Listen to the Answer (Hindi)")
+        return cached["answer"]
+
+    answer_placeholder = st.chat_message("assistant").empty()
+    answer, source_documents = stream_answer_into(answer_placeholder, question, conversation_history, web_info=web_info)
+    sources = [
+        {"text": doc.page_content[:200], "source": doc.metadata.get("source", "Unknown Source")}
+        for doc in source_documents
+    ]
+    show_sources(sources)
+
+    hindi_answer = translate_to_hindi(answer, sarvam_api_key())
+    if max_hindi_chars and len(hindi_answer) > max_hindi_chars:
+        hindi_answer = hindi_answer[:max_hindi_chars]
+    logger.debug("hindi_answer length: %d", len(hindi_answer))
+    audio_file = stream_hindi_audio(hindi_answer, "### Listen to the Answer (Hindi)")
+    if use_cache and audio_file and hindi_answer != TRANSLATION_FAILED:
+        answer_cache.store(question, fingerprint, answer, hindi_answer, audio_file, sources, vector=question_vector)
+    return answer
+
+@st.cache_resource
+def get_metrics_server():
+    # Prometheus-style /metrics endpoint, only when METRICS_PORT is set. Spans are per process,
+    # so with several workers on one machine each takes the first free port from METRICS_PORT
+    # up to METRICS_PORT + METRICS_PORTS - 1; scrape the whole range
+    port = os.environ.get("METRICS_PORT")
+    if not port:
+        return None
+    first_port = int(port)
+    for candidate in range(first_port, first_port + METRICS_PORTS):
+        try:
+            server = start_metrics_server(candidate)
+        except OSError:
+            # Taken, usually by another worker
+            continue
+        logger.info("Serving /metrics on port %d", candidate)
+        return server
+    logger.warning("No free metrics port in %d-%d; this worker serves no /metrics", first_port, first_port + METRICS_PORTS - 1)
+    return None
 
 # Streamlit app setup
 st.title("Prescription Chatbot")
 st.subheader("Upload a prescription image and ask questions about your medicines")
 
-# File uploader for prescription image
-uploaded_file = st.file_uploader("Upload Prescription Image (PNG)", type="png")
+get_metrics_server()
+start_session_gc()
+
+# Per-stage latency for everything this server process has handled. It covers every
+# session (including their page URLs), so it is only shown when LATENCY_SIDEBAR=1 is set
+if LATENCY_SIDEBAR:
+    with st.sidebar.expander("Latency by stage"):
+        st.text(format_stage_report())
+        # Serializing up to MAX_SPANS spans is only worth it when someone asks for them
+        if st.button("Prepare spans download"):
+            st.download_button("Download spans (JSON lines)", spans_jsonl(), file_name="spans.jsonl")
+
+# A session survives a reconnect to another worker: its id is kept in a cookie and its
+# state in the session store
+if "session_id" not in st.session_state:
+    # Links from before the cookie carried the id in the URL; never trust or keep one
+    if "session" in st.query_params:
+        del st.query_params["session"]
+    session_id = session_id_from_cookie()
+    if session_id is None:
+        session_id = uuid.uuid4().hex
+    st.session_state.session_id = session_id
+    saved = get_session_store().load(session_id)
+    if saved:
+        restore_session(saved)
+if session_id_from_cookie() != st.session_state.session_id:
+    set_session_cookie(st.session_state.session_id)
+
+if st.session_state.get("prescription_text") and st.sidebar.button("Start over with a new prescription"):
+    start_new_session()
+
+# File uploader for prescription image; keyed by session so starting over clears it
+uploaded_file = st.file_uploader("Upload Prescription Image (PNG)", type="png", key=f"upload-{st.session_state.session_id}")
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -35,42 +327,107 @@ if "last_answer_sufficient" not in st.session_state:
     st.session_state.last_answer_sufficient = True
 if "last_question" not in st.session_state:
     st.session_state.last_question = ""
-print(f"Start of script - last_question: '{st.session_state.last_question}' (length: {len(st.session_state.last_question)})")  # Debug
+if "audio_file" not in st.session_state:
+    st.session_state.audio_file = None
+if "answer_timings" not in st.session_state:
+    st.session_state.answer_timings = []
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory(summarize=summarize_history)
+logger.debug("Start of script - last_question: %r", st.session_state.last_question)
+
+def finish_summary_audio():
+    # Record the upload job's TTS result once it is done; True while it is still running
+    tts_stage = st.session_state.get("summary_tts")
+    if tts_stage is None:
+        return False
+    if not tts_stage.done():
+        return True
+    del st.session_state["summary_tts"]
+    try:
+        st.session_state.audio_file = tts_stage.result()
+        st.session_state['audio_generated'] = True
+    except RuntimeError as e:
+        # The persistent view below tries again on the next run
+        logger.warning("Summary audio failed: %s", e)
+    save_session()
+    return False
 
-# Process the uploaded image and extract prescription details once
+# Set for the run that processes an upload: (where to play the summary audio, its chunks)
+summary_audio = None
+
+# Process the uploaded image once as a staged job: extract -> translate -> (TTS, index).
+# TTS and indexing run side by side and each result is shown as soon as its stage finishes;
+# the chat is ready once the index is, and the summary audio keeps playing below it
 if uploaded_file and not st.session_state.prescription_text:
-    st.session_state.prescription_text = extract_prescription(uploaded_file, OPENAI_API_KEY)
-    with open("extracted_truncated_prescription.txt", "w", encoding="utf-8") as file:
-        file.write(st.session_state.prescription_text)
+    from rag_search import setup_rag_pipeline
+    start_trace()
+    # Resolved here, on the script thread; the stages below run on worker threads
+    openai_key, sarvam_key = get_api_keys()
+    prescription_index = get_prescription_index()
+    session_id = st.session_state.session_id
+    artifacts = session_artifacts()
+    audio_chunks = queue.Queue()
+
+    def synthesize_summary(hindi_text):
+        audio_file = tts_output_path(hindi_text, directory=artifacts.directory)
+        for audio_data in text_to_speech_stream(hindi_text, sarvam_key, output_file=audio_file):
+            audio_chunks.put(audio_data)
+        return audio_file
 
-    st.session_state.hindi_text = translate_to_hindi(st.session_state.prescription_text, SARVAM_API_KEY)
-    with open("translated_prescription_hindi.txt", "w", encoding="utf-8") as file:
-        file.write(st.session_state.hindi_text)
+    job = StagedJob()
+    job.add_stage("extract", lambda: extract_prescription(uploaded_file, openai_key))
+    job.add_stage("translate", lambda english_text: translate_to_hindi(english_text, sarvam_key), depends_on=["extract"])
+    job.add_stage("tts", synthesize_summary, depends_on=["translate"])
+    job.add_stage(
+        "index",
+        lambda english_text, hindi_text: setup_rag_pipeline(english_text, hindi_text, prescription_index, session_id),
+        depends_on=["extract", "translate"]
+    )
 
-    success, message = text_to_speech(st.session_state.hindi_text, SARVAM_API_KEY, output_file="output.wav")
-    if not success:
-        st.error(message)
+    with st.expander("View Prescription Summaries", expanded=True):
+        with st.spinner("Reading your prescription..."):
+            st.session_state.prescription_text = job.result("extract")
+        artifacts.write_text(st.session_state.prescription_text, ".en.txt")
+        st.write("### Truncated Prescription Summary in English")
+        st.write(st.session_state.prescription_text)
+
+        with st.spinner("Translating to Hindi..."):
+            st.session_state.hindi_text = job.result("translate")
+        artifacts.write_text(st.session_state.hindi_text, ".hi.txt")
+        st.write("### Prescription Summary in Hindi")
+        st.write(st.session_state.hindi_text)
+
+        # Filled at the end of this run, once the chat below is ready
+        st.write("### Listen to the Prescription Summary (Hindi)")
+        summary_audio = (st.container(), audio_chunks)
 
-    st.session_state.qa_chain = setup_rag_pipeline(st.session_state.prescription_text, st.session_state.hindi_text, OPENAI_API_KEY)
+    with st.spinner("Getting the chat ready..."):
+        st.session_state.qa_chain = job.result("index")
+    # Until it finishes, later runs show the audio as in progress rather than synthesize it again
+    st.session_state.summary_tts = job.futures["tts"]
+    logger.info("Upload stage timings: %s", job.timings)
+    save_session()
 
-# Display prescriptions persistently at the top using an expander
-if st.session_state.prescription_text:
+# Display prescriptions persistently at the top using an expander (already shown when
+# this run processed the upload)
+if st.session_state.prescription_text and summary_audio is None:
     with st.expander("View Prescription Summaries", expanded=True):  # Expanded by default
         st.write("### Truncated Prescription Summary in English")
         st.write(st.session_state.prescription_text)
         st.write("### Prescription Summary in Hindi")
         st.write(st.session_state.hindi_text)
-        if "output.wav" in [f.name for f in st.session_state.get('generated_files', [])] or st.session_state.get('audio_generated', False):
+        if finish_summary_audio():
             st.write("### Listen to the Prescription Summary (Hindi)")
-            st.audio("output.wav")
+            st.info("The audio summary is still being prepared and will be here after your next question.")
+        elif st.session_state.get('audio_generated', False) and os.path.exists(st.session_state.audio_file):
+            st.write("### Listen to the Prescription Summary (Hindi)")
+            st.audio(st.session_state.audio_file)
         else:
-            success, message = text_to_speech(st.session_state.hindi_text, SARVAM_API_KEY, output_file="output.wav")
-            if success:
-                st.write("### Listen to the Prescription Summary (Hindi)")
-                st.audio("output.wav")
+            audio_file = stream_hindi_audio(st.session_state.hindi_text, "### Listen to the Prescription Summary (Hindi)")
+            if audio_file:
+                st.session_state.audio_file = audio_file
                 st.session_state['audio_generated'] = True
-            else:
-                st.error(message)
+                save_session()
 
 # Display conversation history below the prescriptions
 st.write("### Conversation")
@@ -78,72 +435,50 @@ for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
-print(f"Messages: {st.session_state.messages}")
+logger.debug("Messages in session: %d", len(st.session_state.messages))
 
 if st.session_state.messages:
     for message in reversed(st.session_state.messages):
-        print(f"Checking message: {message}")  # Debug
         if message["role"] == "user" and message["content"].strip().lower() != "i need more information.":
             st.session_state.last_question = message["content"]
-            print(f"Set last_question from messages: '{st.session_state.last_question}'")  # Debug
+            logger.debug("Set last_question from messages: %r", st.session_state.last_question)
             break
 
-print(f"Before button logic - last_question: '{st.session_state.last_question}' (length: {len(st.session_state.last_question)})")  # Debug
+logger.debug("Before button logic - last_question: %r", st.session_state.last_question)
 
 # Chat input for follow-up questions
 if prompt := st.chat_input("Ask a question about your prescription (e.g., 'What are the side effects of Paracetamol?')"):
-    print("Chat input block executed")  # Debug
+    start_trace()
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
     st.session_state.last_question = prompt
-    print(f"Set last_question to: {st.session_state.last_question}")  # Debug
+    logger.debug("Set last_question to: %r", st.session_state.last_question)
 
-    if st.session_state.qa_chain:
-        conversation_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.messages[:-1]])
-        
-        answer, source_documents = answer_question(
-            st.session_state.qa_chain,
-            prompt,
-            conversation_history,
-            prescription_text=st.session_state.prescription_text,
-            web_info=None
-        )
-
-        insufficient_answer = "I don't have enough information" in answer.lower() or len(answer) < 50 or "not mentioned" in answer.lower()
-        user_not_satisfied = any("more information" in msg["content"].lower() or "not clear" in msg["content"].lower() for msg in st.session_state.messages[-2:])
+    if get_qa_chain():
+        from rag_search import needs_web_context
+        from web_search import fetch_web_info
+        st.session_state.memory.sync(st.session_state.messages[:-1])
+        conversation_history = st.session_state.memory.history()
 
-        if insufficient_answer or user_not_satisfied or not st.session_state.last_answer_sufficient:
+        # Decide up front whether web context is needed so each question costs one completion
+        web_info = None
+        if needs_web_context(
+            prompt,
+            st.session_state.prescription_text,
+            st.session_state.messages[-2:],
+            st.session_state.last_answer_sufficient,
+            local_coverage=get_prescription_index().covers_question(prompt)
+        ):
             st.write("Let me search the web for more information...")
             web_info = fetch_web_info(prompt)
-            answer, source_documents = answer_question(
-                st.session_state.qa_chain,
-                prompt,
-                conversation_history,
-                prescription_text=st.session_state.prescription_text,
-                web_info=web_info
-            )
-            st.session_state.last_answer_sufficient = True
-        else:
-            st.session_state.last_answer_sufficient = True
 
+        answer = answer_and_speak(prompt, conversation_history, web_info=web_info)
+        st.session_state.last_answer_sufficient = True
         st.session_state.messages.append({"role": "assistant", "content": answer})
-        with st.chat_message("assistant"):
-            st.markdown(answer)
-
-        st.write("### Sources Used")
-        for doc in source_documents:
-            source = doc.metadata.get("source", "Unknown Source")
-            st.write(f"- {doc.page_content[:200]}... (Source: {source})")
-
-        hindi_answer = translate_to_hindi(answer, SARVAM_API_KEY)
-        success, message = text_to_speech(hindi_answer, SARVAM_API_KEY, output_file="answer_audio.wav")
-        if success:
-            st.write("### Listen to the Answer (Hindi)")
-            st.audio("answer_audio.wav")
-        else:
-            st.error(message)
+        update_conversation_memory()
+        save_session()
 
 # "I need more information" button
 if st.session_state.messages and st.session_state.messages[-1]["role"] == "assistant":
@@ -153,52 +488,50 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "assis
         with st.chat_message("user"):
             st.markdown("I need more information.")
 
-        print(f"last_question: '{st.session_state.last_question}' (length: {len(st.session_state.last_question)})")  # Debug
-        print(f"qa_chain: {st.session_state.qa_chain}")
+        start_trace()
+        logger.debug("More information requested - last_question: %r", st.session_state.last_question)
         
         if st.session_state.last_question and st.session_state.last_question.strip():
+            from web_search import fetch_web_info
             prompt = st.session_state.last_question
-            conversation_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.messages[:-1]])
+            st.session_state.memory.sync(st.session_state.messages[:-1])
+            conversation_history = st.session_state.memory.history()
             st.write("Let me search the web for more information...")
-            print(f"Calling fetch_web_info with prompt: {prompt}")  # Debug
+            logger.debug("Calling fetch_web_info with prompt: %r", prompt)
             web_info = fetch_web_info(prompt)
 
-            if st.session_state.qa_chain:
-                answer, source_documents = answer_question(
-                    st.session_state.qa_chain,
-                    prompt,
-                    conversation_history,
-                    prescription_text=st.session_state.prescription_text,
-                    web_info=web_info
-                )
+            if get_qa_chain():
+                # Not from the cache: the same search gives the same context, and the cached
+                # answer is the one the user just said was not enough
+                answer = answer_and_speak(prompt, conversation_history, web_info=web_info, max_hindi_chars=500, use_cache=False)
             else:
                 answer = f"Additional information from the web: {' '.join([item['text'] for item in web_info])}\n\nIf you need more details, please consult a healthcare professional."
-                source_documents = [Document(page_content=item["text"], metadata={"source": item["url"]}) for item in web_info]
+                st.chat_message("assistant").markdown(answer)
+                show_sources([{"text": item["text"][:200], "source": item["url"]} for item in web_info])
+                hindi_answer = translate_to_hindi(answer, sarvam_api_key())[:500]
+                stream_hindi_audio(hindi_answer, "### Listen to the Answer (Hindi)")
 
             st.session_state.last_answer_sufficient = True
             st.session_state.messages.append({"role": "assistant", "content": answer})
-            with st.chat_message("assistant"):
-                st.markdown(answer)
-
-            if source_documents:
-                st.write("### Sources Used")
-                for doc in source_documents:
-                    source = doc.metadata.get("source", "Unknown Source")
-                    st.write(f"- {doc.page_content[:200]}... (Source: {source})")
-
-            hindi_answer = translate_to_hindi(answer, SARVAM_API_KEY)
-            print (len(hindi_answer))
-            if len(hindi_answer) > 500:
-                hindi_answer = hindi_answer[:500]
-            
-            print(f"Truncated hindi_answer length: {len(hindi_answer)}, content: {hindi_answer}")  # Debug
-            success, message = text_to_speech(hindi_answer, SARVAM_API_KEY, output_file="answer_audio.wav")
-            if success:
-                st.write("### Listen to the Answer (Hindi)")
-                st.audio("answer_audio.wav")
-            else:
-                st.error(message)
+            update_conversation_memory()
+            save_session()
         else:
             st.session_state.messages.append({"role": "assistant", "content": "Please ask a question first before requesting more information."})
+            save_session()
             with st.chat_message("assistant"):
-                st.markdown("Please ask a question first before requesting more information.")
\ No newline at end of file
+                st.markdown("Please ask a question first before requesting more information.")
+
+# Play each summary audio chunk as the TTS stage produces it, now that the chat is usable.
+# No rerun afterwards: the chunk players stay until the next question brings in the full WAV
+if summary_audio is not None:
+    audio_area, audio_chunks = summary_audio
+    tts_stage = st.session_state.summary_tts
+    with audio_area:
+        while not (tts_stage.done() and audio_chunks.empty()):
+            try:
+                st.audio(pcm_to_wav_bytes(audio_chunks.get(timeout=0.1)), format="audio/wav")
+            except queue.Empty:
+                pass
+        if tts_stage.exception() is not None:
+            st.error(str(tts_stage.exception()))
+    finish_summary_audio()
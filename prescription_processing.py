@@ -1,70 +1,228 @@
 # prescription_processing.py (Updated Version)
-from openai import OpenAI
 import base64
+import functools
 import requests
-import json
 import wave
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from disk_cache import CACHE_ROOT, DiskCache, hash_key
+from http_client import OPENAI_MAX_RETRIES, OPENAI_TIMEOUT, ProviderClient, openai_breaker, openai_timeout, request_deadline
+from tracing import in_current_trace, span
 
-def extract_prescription(image_file, api_key):
-    client = OpenAI(api_key=api_key)
-    # Read and encode the image
-    encoded_image = base64.b64encode(image_file.read()).decode("utf-8")
+logger = logging.getLogger(__name__)
+
+EXTRACTION_MODEL = "gpt-4o"
+# The vision call, the SDK's retries included (seconds)
+EXTRACTION_DEADLINE = 90
+EXTRACTION_PROMPT = "You are a helpful chemist. Think of it as you are conversing with the user. Do NOT mention any details about the patient or the doctor. The user has just clicked a picture of the prescription and is now asking for advice on what all medicines do they have to take and when. When the user uploads a picture of their medical prescription you are to guide them on what all medicines have been prescribed to them and how they should be taking the medicines, as written in the prescription. For this you will 1. begin with the condition (if it mentioned) otherwise skip this step 2. begin explaining a) each of the medicines prescribed b) in what form (is it a syrup, tablet, powder, injection or something else) they need to be taken c) why this medicine was this recommended d) how does this medicine help e) dosage and frequency of dosage. In case any dosage is not clear let the user know and then suggest the best dosage practice for the condition of the patient as mentioned in the prescription. f) any precautions that the patient has been prescribed to take. Note: Also I want to use the output of this exercise and pass it along for text to speech conversion. Share the response in such a way that is a flowing conversation wherein each sentence flows into the next meaningfully and effortlessly and not abruptly. Construct your response to meet all of the above conditions. Important: As an example, if the prescription says use a medicine for 5-7 days mention it like so: 5 to 7 days instead of 5-7 days. Summarise within 1000 characters but do NOT leave out medicine related information."
+
+# Cleaned extraction results keyed by image hash + model + prompt
+extraction_cache = DiskCache("extraction", max_bytes=20 * 1024 * 1024)
+
+@functools.lru_cache(maxsize=None)
+def get_openai_client(api_key):
+    # One client (and connection pool) per key for the whole process, built on first use.
+    # openai is imported here so that importing this module stays cheap
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+
+def request_extraction(image_bytes, mime_type, api_key):
+    client = get_openai_client(api_key)
+    encoded_image = base64.b64encode(image_bytes).decode("utf-8")
 
     # Extract details using OpenAI
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "You are a helpful chemist. Think of it as you are conversing with the user. Do NOT mention any details about the patient or the doctor. The user has just clicked a picture of the prescription and is now asking for advice on what all medicines do they have to take and when. When the user uploads a picture of their medical prescription you are to guide them on what all medicines have been prescribed to them and how they should be taking the medicines, as written in the prescription. For this you will 1. begin with the condition (if it mentioned) otherwise skip this step 2. begin explaining a) each of the medicines prescribed b) in what form (is it a syrup, tablet, powder, injection or something else) they need to be taken c) why this medicine was this recommended d) how does this medicine help e) dosage and frequency of dosage. In case any dosage is not clear let the user know and then suggest the best dosage practice for the condition of the patient as mentioned in the prescription. f) any precautions that the patient has been prescribed to take. Note: Also I want to use the output of this exercise and pass it along for text to speech conversion. Share the response in such a way that is a flowing conversation wherein each sentence flows into the next meaningfully and effortlessly and not abruptly. Construct your response to meet all of the above conditions. Important: As an example, if the prescription says use a medicine for 5-7 days mention it like so: 5 to 7 days instead of 5-7 days. Summarise within 1000 characters but do NOT leave out medicine related information."},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded_image}"}},
-                ],
-            }
-        ],
-    )
-    extracted_text = response.choices[0].message.content
-    print (extracted_text)
+    with request_deadline(EXTRACTION_DEADLINE), span("vision_extraction", payload_bytes=len(encoded_image)) as attributes, openai_breaker.guard():
+        response = client.with_options(timeout=openai_timeout()).chat.completions.create(
+            model=EXTRACTION_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": EXTRACTION_PROMPT},
+                        {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded_image}"}},
+                    ],
+                }
+            ],
+        )
+        if response.usage:
+            attributes["prompt_tokens"] = response.usage.prompt_tokens
+            attributes["completion_tokens"] = response.usage.completion_tokens
+    return response.choices[0].message.content
+
+def extract_prescription(image_file, api_key, preprocess=True):
+    # Pillow is only needed once an image is uploaded
+    from image_preprocessing import PREPROCESS_VERSION, preprocess_image
+
+    # Read the image once; the same bytes are used for the cache key and the request
+    image_bytes = image_file.read()
+    cache_key = hash_key(image_bytes, EXTRACTION_MODEL, EXTRACTION_PROMPT, PREPROCESS_VERSION if preprocess else "raw")
+    cached_text = extraction_cache.get(cache_key)
+    if cached_text is not None:
+        logger.debug("Extraction cache hit: %s", extraction_cache.stats())
+        return cached_text.decode("utf-8")
+
+    if preprocess:
+        # Downscale, grayscale, deskew and crop before sending; the raw bytes are not needed after this
+        with span("image_preprocessing", input_bytes=len(image_bytes)) as attributes:
+            image_bytes, mime_type, stats = preprocess_image(image_bytes)
+            attributes["output_bytes"] = stats["bytes_after"]
+        logger.info("Image preprocessing saved %d bytes and %d vision tokens (%s)",
+                    stats["bytes_before"] - stats["bytes_after"], stats["tokens_before"] - stats["tokens_after"], stats)
+    else:
+        mime_type = "image/png"
+
+    extracted_text = request_extraction(image_bytes, mime_type, api_key)
+    logger.debug("Extracted text: %s", extracted_text)
 
     # Clean the extracted text
     extracted_text_cleaned = extracted_text.replace("**", "").replace("#", "").replace("-", "").replace("\n", " ")
     extracted_text_cleaned = " ".join(extracted_text_cleaned.split())
     extracted_text_truncated = extracted_text_cleaned[:500]
+    extraction_cache.set(cache_key, extracted_text_truncated.encode("utf-8"))
     return extracted_text_truncated
 
-def translate_to_hindi(text, api_key):
-    SARVAM_TRANSLATE_URL = "https://api.sarvam.ai/translate"
+# Overridable so the benchmarks can point at a local stand-in
+SARVAM_BASE_URL = os.environ.get("SARVAM_BASE_URL", "https://api.sarvam.ai")
+SARVAM_TRANSLATE_URL = f"{SARVAM_BASE_URL}/translate"
+TRANSLATE_MODE = "classic-colloquial"
+# Returned by translate_to_hindi in place of the Hindi text when any sentence could not be translated
+TRANSLATION_FAILED = "Translation failed"
+MAX_TRANSLATE_CHARS = 1000
+TRANSLATE_TIMEOUT = 10
+# Whole translate_to_hindi call, retries and all (seconds)
+TRANSLATE_DEADLINE = 30
+# Per-sentence requests sent at once when a batch reply loses its line structure
+MAX_TRANSLATE_WORKERS = 8
+
+# Pooled, retrying client for translation; TTS has its own so that a TTS outage
+# does not stop translation (see tts_client)
+sarvam_client = ProviderClient("sarvam_translate", timeout=TRANSLATE_TIMEOUT)
+
+translate_executor = ThreadPoolExecutor(max_workers=MAX_TRANSLATE_WORKERS, thread_name_prefix="translate")
+
+# Sentence-level translation memory shared by all sessions
+translation_memory = DiskCache("translation", max_bytes=20 * 1024 * 1024)
+
+# A sentence ends at a full stop, question or exclamation mark, or the danda (।) that
+# ends sentences in Sarvam's Hindi output
+SENTENCE_END = re.compile(r"(?<=[.?!।])\s+")
+
+def split_sentences(text):
+    # Same sentence boundary as split_text_meaningfully, keeping the end mark
+    return [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+
+def _translate_request(text, api_key):
     translate_payload = {
         "enable_preprocessing": True,
         "input": text,
         "source_language_code": "en-IN",
         "target_language_code": "hi-IN",
-        "mode": "classic-colloquial"
+        "mode": TRANSLATE_MODE
     }
     headers = {
         "api-subscription-key": api_key,
         "Content-Type": "application/json"
     }
-    translate_response = requests.post(SARVAM_TRANSLATE_URL, json=translate_payload, headers=headers)
-    hindi_text = translate_response.json().get("translated_text", "Translation failed")
-    print (hindi_text)
+    # None on any failure; the caller falls back to per-sentence requests and then gives up
+    try:
+        with span("translation", input_chars=len(text)) as attributes:
+            translate_response = sarvam_client.post(SARVAM_TRANSLATE_URL, json=translate_payload, headers=headers)
+            attributes["status_code"] = translate_response.status_code
+            attributes["response_bytes"] = len(translate_response.content)
+        if translate_response.status_code != 200:
+            logger.warning("Translation failed with status %s: %s", translate_response.status_code, translate_response.text[:200])
+            return None
+        return translate_response.json().get("translated_text")
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Translation request failed: %s", e)
+        return None
+
+def _translate_batch(sentences, api_key):
+    # One request per batch, one sentence per line; fall back to one request
+    # per sentence if the line structure does not survive translation
+    translated = _translate_request("\n".join(sentences), api_key)
+    lines = [line.strip() for line in translated.split("\n") if line.strip()] if translated else []
+    if len(lines) == len(sentences):
+        return lines
+    if len(sentences) == 1:
+        return [translated]
+    # The "translation_fallback" spans count how often this happens (see stage_report)
+    logger.warning("Batch translation returned %d lines for %d sentences; translating them one by one",
+                   len(lines), len(sentences))
+    with span("translation_fallback", sentences=len(sentences), returned_lines=len(lines)):
+        # All at once over the pooled client, under the caller's deadline
+        futures = [translate_executor.submit(in_current_trace(_translate_request), sentence, api_key) for sentence in sentences]
+        return [future.result() for future in futures]
+
+def translate_to_hindi(text, api_key):
+    sentences = split_sentences(" ".join(text.split("\n")))
+    keys = [hash_key(sentence, "en-IN", "hi-IN", TRANSLATE_MODE) for sentence in sentences]
+    translations = {}
+    for key in keys:
+        cached = translation_memory.get(key)
+        if cached is not None:
+            translations[key] = cached.decode("utf-8")
+
+    # Only sentences missing from memory go to Sarvam, packed into as few requests as possible
+    missing = list(dict.fromkeys(k for k in keys if k not in translations))
+    sentence_by_key = dict(zip(keys, sentences))
+    batches = []
+    current_batch = []
+    current_length = 0
+    for key in missing:
+        length = len(sentence_by_key[key]) + 1
+        if current_batch and current_length + length > MAX_TRANSLATE_CHARS:
+            batches.append(current_batch)
+            current_batch, current_length = [], 0
+        current_batch.append(key)
+        current_length += length
+    if current_batch:
+        batches.append(current_batch)
+
+    with request_deadline(TRANSLATE_DEADLINE):
+        for batch in batches:
+            results = _translate_batch([sentence_by_key[key] for key in batch], api_key)
+            for key, hindi_sentence in zip(batch, results):
+                if hindi_sentence:
+                    translations[key] = hindi_sentence
+                    translation_memory.set(key, hindi_sentence.encode("utf-8"))
+
+    if any(key not in translations for key in keys):
+        hindi_text = TRANSLATION_FAILED
+    else:
+        hindi_text = " ".join(translations[key] for key in keys)
+    logger.debug("Translated %d sentences, %d sent to Sarvam in %d requests", len(sentences), len(missing), len(batches))
+    logger.debug("Hindi text: %s", hindi_text)
     return hindi_text
 
+def _split_long_sentence(sentence, max_length):
+    # Break a sentence longer than max_length at the last space that fits (or mid-word if none does)
+    pieces = []
+    while len(sentence) > max_length:
+        cut = sentence.rfind(" ", 0, max_length + 1)
+        if cut <= 0:
+            cut = max_length
+        pieces.append(sentence[:cut].strip())
+        sentence = sentence[cut:].strip()
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
 def split_text_meaningfully(text, max_length=500):
+    # Whole sentences packed into chunks of at most max_length characters (the TTS input limit)
     chunks = []
     current_chunk = ""
-    sentences = text.split(". ")  # Split by sentence (period + space)
 
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) + 1 <= max_length:
-            if current_chunk:
-                current_chunk += ". " + sentence
-            else:
-                current_chunk = sentence
-        else:
-            if current_chunk:
+    for sentence in split_sentences(text):
+        for piece in _split_long_sentence(sentence, max_length):
+            if current_chunk and len(current_chunk) + len(piece) + 1 > max_length:
                 chunks.append(current_chunk)
-            current_chunk = sentence
+                current_chunk = ""
+            current_chunk = f"{current_chunk} {piece}".strip()
 
     if current_chunk:
         chunks.append(current_chunk)
@@ -139,58 +297,196 @@ def text_to_speech(text, api_key, output_file="output.wav"):
 """
 
 
-def text_to_speech(text, api_key, output_file="output.wav"):
-    # Clean the text
+SARVAM_TTS_URL = f"{SARVAM_BASE_URL}/text-to-speech"
+TTS_SPEAKER = "meera"
+TTS_PITCH = 0.5
+TTS_PACE = 1
+TTS_MODEL = "bulbul:v1"
+TTS_SAMPLE_RATE = 22050
+AUDIO_DIR = os.path.join(CACHE_ROOT, "audio")
+# Smaller chunks in streaming mode so the first sentence is ready quickly
+STREAM_CHUNK_LENGTH = 200
+MAX_TTS_WORKERS = 4
+TTS_TIMEOUT = 20
+# All the chunks of one text_to_speech(_stream) call, retries and all (seconds)
+TTS_DEADLINE = 60
+# Resend a chunk that has not come back after this many seconds and use whichever
+# copy answers first. Off by default: every hedged chunk is billed twice
+TTS_HEDGE_AFTER = None
+
+# Its own circuit breaker: while TTS is failing, answers are shown as text only
+tts_client = ProviderClient("sarvam_tts", timeout=TTS_TIMEOUT, hedge_after=TTS_HEDGE_AFTER, pool_size=MAX_TTS_WORKERS)
+
+tts_executor = ThreadPoolExecutor(max_workers=MAX_TTS_WORKERS, thread_name_prefix="tts")
+
+# Decoded PCM per text chunk, keyed by chunk text + voice settings
+tts_cache = DiskCache("tts", max_bytes=200 * 1024 * 1024)
+
+def _clean_tts_text(text):
     text_cleaned = text.replace("**", "").replace("#", "").replace("-", "").replace("\n", " ")
-    text_cleaned = " ".join(text_cleaned.split())
+    return " ".join(text_cleaned.split())
 
-    # Save the cleaned text for debugging
-    with open("cleaned_prescription_hindi.txt", "w", encoding="utf-8") as file:
-        file.write(text_cleaned)
+def pcm_to_wav_bytes(pcm_data):
+    # Wrap raw PCM in a WAV header so it can be played directly (e.g. st.audio)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(TTS_SAMPLE_RATE)
+        wav_file.writeframes(pcm_data)
+    return buffer.getvalue()
 
-    # Split the text into chunks for TTS
-    text_chunks = split_text_meaningfully(text_cleaned, max_length=500)
+def tts_output_path(text, speaker=TTS_SPEAKER, pace=TTS_PACE, pitch=TTS_PITCH, directory=AUDIO_DIR):
+    # Content-addressed WAV path so concurrent sessions never share an output file
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{hash_key(text, speaker, str(pace), str(pitch), TTS_MODEL)}.wav")
 
-    # Generate audio using Sarvam TTS
-    url = "https://api.sarvam.ai/text-to-speech"
+def _tts_chunk_key(chunk, speaker, pace, pitch):
+    return hash_key(chunk, speaker, str(pace), str(pitch), TTS_MODEL, str(TTS_SAMPLE_RATE), "hi-IN")
+
+def _decode_audio(audio_base64):
+    audio_base64 = audio_base64.strip()
+    missing_padding = len(audio_base64) % 4
+    if missing_padding:
+        audio_base64 += "=" * (4 - missing_padding)
+    return base64.b64decode(audio_base64)
+
+def _synthesize_chunks(text_chunks, api_key, speaker, pace, pitch):
     payload = {
-        "speaker": "meera",
+        "speaker": speaker,
         "loudness": 1,
-        "speech_sample_rate": 22050,
+        "speech_sample_rate": TTS_SAMPLE_RATE,
         "enable_preprocessing": True,
         "override_triplets": {},
         "target_language_code": "hi-IN",
         "inputs": text_chunks,
-        "pitch": 0.5,
-        "pace": 1,
-        "model": "bulbul:v1"
+        "pitch": pitch,
+        "pace": pace,
+        "model": TTS_MODEL
     }
     headers = {
         "api-subscription-key": api_key,
         "Content-Type": "application/json"
     }
-    response = requests.post(url, json=payload, headers=headers)
-    response_data = json.loads(response.text)
+    try:
+        with span("tts", chunks=len(text_chunks), input_chars=sum(len(chunk) for chunk in text_chunks)) as attributes:
+            response = tts_client.post(SARVAM_TTS_URL, json=payload, headers=headers)
+            attributes["status_code"] = response.status_code
+            attributes["response_bytes"] = len(response.content)
+    except requests.RequestException as e:
+        return None, f"TTS request failed: {e}"
 
+    # Check the status before trusting the body: error pages are not always JSON
     if response.status_code != 200:
-        return False, f"TTS API call failed: {response_data.get('message', 'No message')}"
-    
-    audio_base64_list = response_data["audios"]
-    audio_data_list = []
-    for i, audio_base64 in enumerate(audio_base64_list):
-        audio_base64 = audio_base64.strip()
-        missing_padding = len(audio_base64) % 4
-        if missing_padding:
-            audio_base64 += "=" * (4 - missing_padding)
-        audio_data = base64.b64decode(audio_base64)
-        audio_data_list.append(audio_data)
+        return None, f"TTS API call failed with status {response.status_code}: {response.text[:200]}"
+    try:
+        audios = response.json().get("audios")
+    except ValueError as e:
+        return None, f"Invalid JSON response: {e}"
+    if not isinstance(audios, list) or len(audios) != len(text_chunks):
+        return None, f"API response missing audio data: {response.text[:200]}"
 
-    # Combine audio data
-    combined_audio_data = b"".join(audio_data_list)
-    with wave.open(output_file, "wb") as wav_file:
+    return [_decode_audio(audio_base64) for audio_base64 in audios], None
+
+def tts_available():
+    # False while the TTS circuit is open; callers should skip audio instead of waiting on it
+    return tts_client.available
+
+def text_to_speech(text, api_key, output_file=None, speaker=TTS_SPEAKER, pace=TTS_PACE, pitch=TTS_PITCH):
+    if output_file is None:
+        output_file = tts_output_path(text, speaker, pace, pitch)
+
+    # Clean the text
+    text_cleaned = _clean_tts_text(text)
+
+    # Logged rather than written to a fixed file, which concurrent callers would overwrite
+    logger.debug("Cleaned TTS text: %s", text_cleaned)
+
+    # Split the text into chunks for TTS
+    text_chunks = split_text_meaningfully(text_cleaned, max_length=500)
+
+    # Reuse cached PCM and only synthesize the chunks we have not heard before
+    keys = [_tts_chunk_key(chunk, speaker, pace, pitch) for chunk in text_chunks]
+    audio_by_key = {}
+    for key in keys:
+        cached_audio = tts_cache.get(key)
+        if cached_audio is not None:
+            audio_by_key[key] = cached_audio
+
+    missing = [(key, chunk) for key, chunk in dict(zip(keys, text_chunks)).items() if key not in audio_by_key]
+    if missing:
+        with request_deadline(TTS_DEADLINE):
+            audio_data_list, error = _synthesize_chunks([chunk for _, chunk in missing], api_key, speaker, pace, pitch)
+        if error:
+            return False, error
+        for (key, _), audio_data in zip(missing, audio_data_list):
+            audio_by_key[key] = audio_data
+            tts_cache.set(key, audio_data)
+
+    # Write the WAV incrementally, one chunk at a time, and put it in place once complete
+    tmp_file = _partial_path(output_file)
+    with wave.open(tmp_file, "wb") as wav_file:
         wav_file.setnchannels(1)
         wav_file.setsampwidth(2)
-        wav_file.setframerate(22050)
-        wav_file.writeframes(combined_audio_data)
+        wav_file.setframerate(TTS_SAMPLE_RATE)
+        for key in keys:
+            wav_file.writeframes(audio_by_key[key])
+    os.replace(tmp_file, output_file)
+
+    return True, "Audio generated successfully."
+
+def _partial_path(output_file):
+    # One per writer: the upload job and a rerun may write the same text's WAV at the same time
+    return f"{output_file}.{os.getpid()}.{threading.get_ident()}.partial"
+
+def _synthesize_one(chunk, key, api_key, speaker, pace, pitch):
+    audio_data_list, error = _synthesize_chunks([chunk], api_key, speaker, pace, pitch)
+    if error:
+        raise RuntimeError(error)
+    tts_cache.set(key, audio_data_list[0])
+    return audio_data_list[0]
+
+def text_to_speech_stream(text, api_key, output_file=None, speaker=TTS_SPEAKER, pace=TTS_PACE, pitch=TTS_PITCH,
+                          max_length=STREAM_CHUNK_LENGTH):
+    """Yield decoded PCM for each chunk, in order, as soon as it is ready.
 
-    return True, "Audio generated successfully."
\ No newline at end of file
+    All uncached chunks are synthesized concurrently, so the first chunk is
+    available after one chunk's round trip. The complete WAV is written to
+    output_file once the last chunk arrives. Raises RuntimeError if the TTS
+    call fails.
+    """
+    if output_file is None:
+        output_file = tts_output_path(text, speaker, pace, pitch)
+
+    text_chunks = split_text_meaningfully(_clean_tts_text(text), max_length=max_length)
+    keys = [_tts_chunk_key(chunk, speaker, pace, pitch) for chunk in text_chunks]
+
+    pending = {}
+    # The deadline is captured with the trace context, so it bounds the worker threads too
+    with request_deadline(TTS_DEADLINE):
+        for key, chunk in zip(keys, text_chunks):
+            if key in pending:
+                continue
+            cached_audio = tts_cache.get(key)
+            if cached_audio is None:
+                pending[key] = tts_executor.submit(in_current_trace(_synthesize_one), chunk, key, api_key, speaker, pace, pitch)
+            else:
+                pending[key] = cached_audio
+
+    tmp_file = _partial_path(output_file)
+    try:
+        with wave.open(tmp_file, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(TTS_SAMPLE_RATE)
+            for key in keys:
+                audio_data = pending[key]
+                if not isinstance(audio_data, bytes):
+                    audio_data = audio_data.result()
+                wav_file.writeframes(audio_data)
+                yield audio_data
+        os.replace(tmp_file, output_file)
+    finally:
+        # Don't leave half-written audio behind if synthesis failed or the caller stopped early
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
@@ -1,26 +1,215 @@
 # rag_search.py
+import math
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
 from langchain.chains import RetrievalQA
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 from langchain.prompts import PromptTemplate
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+import faiss
+import numpy as np
+from disk_cache import CACHE_ROOT, DiskCache, hash_key
+from http_client import OPENAI_MAX_RETRIES, OPENAI_TIMEOUT, openai_breaker, openai_timeout, request_deadline
+from prescription_processing import split_sentences
+from tracing import span
 
-def setup_rag_pipeline(prescription_text, hindi_text, openai_api_key):
-    # Initialize embeddings and LLM
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-    llm = ChatOpenAI(model_name="gpt-4o", openai_api_key=openai_api_key)
+# Drug monograph index built offline by ingest_corpus.py
+DRUG_INDEX_DIR = os.environ.get("DRUG_INDEX_DIR", os.path.join(CACHE_ROOT, "drug_index"))
+CORPUS_K = 3
+# Corpus passages below this relevance (0..1) are not used as context
+CORPUS_MIN_RELEVANCE = 0.8
 
-    # Combine English and Hindi prescription text into a single document
-    combined_text = f"English Prescription:\n{prescription_text}\n\nHindi Prescription:\n{hindi_text}"
-    
-    # Create a Document object with metadata
-    documents = [Document(page_content=combined_text, metadata={"source": "prescription"})]
+# Recent question embeddings kept in memory, so the corpus check, the answer cache
+# and retrieval for the same question share one embedding call. All of them are also
+# kept on disk: CacheBackedEmbeddings only caches embed_documents, not embed_query
+QUERY_EMBEDDING_CACHE = 256
+QUERY_EMBEDDING_CACHE_BYTES = 50 * 1024 * 1024
 
-    # Create a vector store with the documents
-    vector_store = FAISS.from_documents(documents, embeddings)
+# Streaming one answer, the SDK's retries included (seconds)
+ANSWER_DEADLINE = 60
 
-    # Set up the retriever
-    retriever = vector_store.as_retriever(search_kwargs={"k": 2})
+# Documents of sessions not searched for this long are dropped on the next upload, so the
+# in-memory index does not grow forever; restore_rag_pipeline re-adds them if the session returns
+INDEX_SESSION_TTL = 24 * 60 * 60
+
+# A sentence naming one of these usually introduces the next medicine in the summary
+DOSAGE_FORMS = ("tablet", "capsule", "syrup", "injection", "powder", "drops", "cream", "ointment", "gel", "inhaler", "suspension", "sachet")
+
+def build_embeddings(openai_api_key):
+    # OpenAI embeddings behind an on-disk cache keyed by text hash
+    underlying_embeddings = OpenAIEmbeddings(
+        openai_api_key=openai_api_key, request_timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES
+    )
+    store = LocalFileStore(os.path.join(CACHE_ROOT, "embeddings"))
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying_embeddings, store, namespace=underlying_embeddings.model
+    )
+
+def load_drug_index(embeddings, index_dir=DRUG_INDEX_DIR):
+    """Memory-map the drug monograph index, or return None if it has not been built."""
+    index_path = os.path.join(index_dir, "index.faiss")
+    if not os.path.exists(index_path):
+        return None
+    index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+    with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def split_by_medicine(prescription_text):
+    # Group the summary's sentences so each chunk covers one medicine
+    chunks = []
+    current_chunk = []
+    current_has_medicine = False
+    for sentence in split_sentences(prescription_text):
+        mentions_medicine = any(form in sentence.lower() for form in DOSAGE_FORMS)
+        if mentions_medicine and current_has_medicine:
+            chunks.append(" ".join(current_chunk))
+            current_chunk = []
+            current_has_medicine = False
+        current_chunk.append(sentence)
+        current_has_medicine = current_has_medicine or mentions_medicine
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+    return chunks
+
+class PrescriptionIndex:
+    """Prescription documents of every session in the process, plus the drug corpus.
+
+    A session's documents (one short chunk per medicine and the Hindi
+    summary) are all returned for every question, so none of its medicines
+    can be ranked out of the context; only the drug corpus passages are
+    ranked by similarity. The embeddings client and the LLM client are
+    shared by all sessions. Query embeddings are cached in memory and on
+    disk by text hash and model, so they survive a restart.
+    """
+
+    def __init__(self, openai_api_key, drug_index_dir=DRUG_INDEX_DIR):
+        self.embeddings = build_embeddings(openai_api_key)
+        self.embedding_model = self.embeddings.underlying_embeddings.model
+        self._query_embedding_store = DiskCache("query_embeddings", max_bytes=QUERY_EMBEDDING_CACHE_BYTES)
+        self.llm = ChatOpenAI(
+            model_name="gpt-4o", openai_api_key=openai_api_key, request_timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES
+        )
+        self.drug_index = load_drug_index(self.embeddings, drug_index_dir)
+        self._documents_by_session = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._query_embeddings = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    def embed_query(self, text):
+        with self._query_lock:
+            if text in self._query_embeddings:
+                self._query_embeddings.move_to_end(text)
+                return self._query_embeddings[text]
+        store_key = hash_key(text, self.embedding_model)
+        stored = self._query_embedding_store.get(store_key)
+        if stored is not None:
+            embedding = np.frombuffer(stored, dtype=np.float32).tolist()
+        else:
+            with span("embedding", texts=1, input_chars=len(text)):
+                embedding = self.embeddings.embed_query(text)
+            self._query_embedding_store.set(store_key, np.asarray(embedding, dtype=np.float32).tobytes())
+        with self._query_lock:
+            self._query_embeddings[text] = embedding
+            if len(self._query_embeddings) > QUERY_EMBEDDING_CACHE:
+                self._query_embeddings.popitem(last=False)
+        return embedding
+
+    def add_documents(self, session_id, documents):
+        # Replaces the session's documents; sessions idle for INDEX_SESSION_TTL are dropped
+        documents = [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "session_id": session_id})
+            for doc in documents
+        ]
+        with self._lock:
+            cutoff = time.time() - INDEX_SESSION_TTL
+            for idle_session_id in [key for key, last_used in self._last_used.items() if last_used < cutoff]:
+                self._remove_session(idle_session_id)
+            self._documents_by_session[session_id] = documents
+            self._last_used[session_id] = time.time()
+
+    def remove_session(self, session_id):
+        with self._lock:
+            self._remove_session(session_id)
+
+    def has_session(self, session_id):
+        with self._lock:
+            return session_id in self._documents_by_session
+
+    def _remove_session(self, session_id):
+        self._last_used.pop(session_id, None)
+        self._documents_by_session.pop(session_id, None)
+
+    def search(self, session_id, query):
+        with span("retrieval") as attributes:
+            with self._lock:
+                documents = list(self._documents_by_session.get(session_id, []))
+                if documents:
+                    self._last_used[session_id] = time.time()
+            if self.drug_index is not None:
+                documents = documents + self._search_corpus(self.embed_query(query))
+            attributes["documents"] = len(documents)
+        return documents
+
+    def _search_corpus(self, query_embedding, k=CORPUS_K):
+        if self.drug_index is None:
+            return []
+        results = self.drug_index.similarity_search_with_score_by_vector(query_embedding, k=k)
+        # Same euclidean-to-relevance mapping langchain uses for FAISS
+        return [doc for doc, distance in results if 1.0 - distance / math.sqrt(2) >= CORPUS_MIN_RELEVANCE]
+
+    def covers_question(self, question):
+        """True if the local drug corpus has a relevant passage for the question."""
+        if self.drug_index is None:
+            return False
+        query_embedding = self.embed_query(question)
+        return bool(self._search_corpus(query_embedding, k=1))
+
+    def as_retriever(self, session_id):
+        return SessionRetriever(index=self, session_id=session_id)
+
+
+class SessionRetriever(BaseRetriever):
+    index: Any
+    session_id: str
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.index.search(self.session_id, query)
+
+
+def prescription_documents(prescription_text, hindi_text):
+    # One chunk per medicine from the English summary, plus the Hindi summary as a whole
+    documents = [
+        Document(page_content=f"English Prescription:\n{chunk}", metadata={"source": "prescription"})
+        for chunk in split_by_medicine(prescription_text)
+    ]
+    documents.append(Document(page_content=f"Hindi Prescription:\n{hindi_text}", metadata={"source": "prescription"}))
+    return documents
+
+def setup_rag_pipeline(prescription_text, hindi_text, index, session_id):
+    # Add the documents to the shared index under this session
+    index.add_documents(session_id, prescription_documents(prescription_text, hindi_text))
+    return build_qa_chain(index, session_id)
+
+def restore_rag_pipeline(prescription_text, hindi_text, index, session_id):
+    # For a session saved by another worker or before a restart: its documents are only
+    # re-added if this process's index does not have them
+    if not index.has_session(session_id):
+        index.add_documents(session_id, prescription_documents(prescription_text, hindi_text))
+    return build_qa_chain(index, session_id)
+
+def build_qa_chain(index, session_id):
+    # Set up the retriever (all the session's chunks plus any relevant drug monograph passages)
+    retriever = index.as_retriever(session_id)
 
     # Define the prompt template
     prompt_template = """Use the following pieces of context to answer the user's question.
@@ -36,7 +225,7 @@ def setup_rag_pipeline(prescription_text, hindi_text, openai_api_key):
 
     # Set up the RAG chain
     qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
+        llm=index.llm,
         chain_type="stuff",
         retriever=retriever,
         return_source_documents=True,
@@ -46,43 +235,108 @@ def setup_rag_pipeline(prescription_text, hindi_text, openai_api_key):
     return qa_chain
 
 def answer_question(qa_chain, question, conversation_history, prescription_text=None, web_info=None):
-    # Step 1: Use the RAG pipeline to search the prescription text
-    full_query = f"Conversation History:\n{conversation_history}\n\nCurrent Question: {question}"
+    # Step 1: Web context is already decided by the caller (see needs_web_context),
+    # so a single chain call answers the question either way
+    full_query = build_query(question, conversation_history, prescription_text, web_info)
     result = qa_chain({"query": full_query})
     answer = result["result"]
     source_documents = result["source_documents"]
 
-    # Step 2: Check if the answer is sufficient
-    insufficient_answer = (
-        "I don't have enough information" in answer.lower() or
+    # Step 2: If web info is provided (e.g., after "I need more information"), cite it as a source
+    if web_info:
+        for item in web_info:
+            source_documents.append(Document(page_content=item["text"], metadata={"source": item["url"]}))
+        return answer, source_documents
+
+    # Step 3: If the answer is insufficient, return the answer with a note
+    if is_insufficient_answer(answer, question):
+        answer += insufficient_answer_note(question)
+
+    return answer, source_documents
+
+def insufficient_answer_note(question):
+    # Appended rather than prepended, so the streaming path can add it once the answer is complete
+    return (
+        f"\n\nThe prescription text does not contain specific information about {question}. "
+        f"The answer above is a general answer based on available knowledge."
+    )
+
+def is_insufficient_answer(answer, question):
+    return (
+        "i don't have enough information" in answer.lower() or
         "not mentioned" in answer.lower() or
         len(answer) < 50 or
         "alternatives" in question.lower() and "alternatives" not in answer.lower()
     )
 
-    # Step 3: If the answer is insufficient and no web info is provided, return the answer with a note
-    if insufficient_answer and not web_info:
-        answer = (
-            f"The prescription text does not contain specific information about {question}. "
-            f"Here is a general answer based on available knowledge:\n\n{answer}"
-        )
-        return answer, source_documents
+# Topics the prescription summary rarely covers; asking about them goes straight to the web
+WEB_TOPICS = ("side effect", "alternative", "interaction", "contraindication", "overdose", "pregnan", "alcohol", "allerg")
+FOLLOW_UP_PHRASES = ("more information", "not clear")
+
+def needs_web_context(question, prescription_text, recent_messages=(), last_answer_sufficient=True, local_coverage=False):
+    """Decide before calling the LLM whether the answer needs web context."""
+    if not last_answer_sufficient:
+        return True
+    if any(phrase in msg["content"].lower() for msg in recent_messages for phrase in FOLLOW_UP_PHRASES):
+        return True
+    if local_coverage:
+        # The drug monograph corpus already has a relevant passage
+        return False
+    question_lower = question.lower()
+    prescription_lower = (prescription_text or "").lower()
+    return any(topic in question_lower and topic not in prescription_lower for topic in WEB_TOPICS)
+
+def build_query(question, conversation_history, prescription_text=None, web_info=None):
+    if not web_info:
+        return f"Conversation History:\n{conversation_history}\n\nCurrent Question: {question}"
+    web_info_text = "\n\n".join([f"Web Info from {item['url']}:\n{item['text']}" for item in web_info])
+    return (
+        f"Conversation History:\n{conversation_history}\n\n"
+        f"Current Question: {question}\n\n"
+        f"Prescription Information:\n{prescription_text}\n\n"
+        f"Additional Info from Web: {web_info_text}"
+    )
+
+def stream_answer(qa_chain, question, conversation_history, prescription_text=None, web_info=None, timings=None):
+    """Retrieve context for the question and return (source_documents, tokens).
+
+    tokens is a generator yielding the answer text as the LLM produces it.
+    If a timings dict is passed, time_to_first_token and total_latency (in
+    seconds, measured from this call) are filled in once the stream ends.
+    """
+    start = time.perf_counter()
+    full_query = build_query(question, conversation_history, prescription_text, web_info)
+    source_documents = qa_chain.retriever.get_relevant_documents(full_query)
+
+    # Same prompt RetrievalQA's "stuff" chain would build, sent straight to the LLM
+    llm_chain = qa_chain.combine_documents_chain.llm_chain
+    context = "\n\n".join(doc.page_content for doc in source_documents)
+    prompt_text = llm_chain.prompt.format(context=context, question=full_query)
 
-    # Step 4: If web info is provided (e.g., after "I need more information"), include it in the answer
     if web_info:
-        # Combine web info text for the context
-        web_info_text = "\n\n".join([f"Web Info from {item['url']}:\n{item['text']}" for item in web_info])
-        full_query_with_web = (
-            f"Conversation History:\n{conversation_history}\n\n"
-            f"Current Question: {question}\n\n"
-            f"Prescription Information:\n{prescription_text}\n\n"
-            f"Additional Info from Web: {web_info_text}"
-        )
-        result = qa_chain({"query": full_query_with_web})
-        answer = result["result"]
-        source_documents = result["source_documents"]
-        # Append web info to source_documents
         for item in web_info:
             source_documents.append(Document(page_content=item["text"], metadata={"source": item["url"]}))
 
-    return answer, source_documents
\ No newline at end of file
+    def tokens():
+        first_token_at = None
+        answer_parts = []
+        with request_deadline(ANSWER_DEADLINE), span("llm_completion", prompt_chars=len(prompt_text)) as attributes, openai_breaker.guard():
+            completion_chunks = 0
+            for chunk in llm_chain.llm.stream(prompt_text, timeout=openai_timeout()):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    attributes["time_to_first_token"] = first_token_at - start
+                completion_chunks += 1
+                answer_parts.append(chunk.content)
+                yield chunk.content
+            # OpenAI streams roughly one token per chunk
+            attributes["completion_tokens"] = completion_chunks
+        if timings is not None:
+            end = time.perf_counter()
+            timings["time_to_first_token"] = (first_token_at or end) - start
+            timings["total_latency"] = end - start
+        # Same note answer_question adds, once the whole answer is known
+        if not web_info and is_insufficient_answer("".join(answer_parts), question):
+            yield insufficient_answer_note(question)
+
+    return source_documents, tokens()
@@ -0,0 +1,150 @@
+# session_store.py
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from disk_cache import CACHE_ROOT, hash_key
+
+# Where sessions are kept: a directory of JSON files (default) or sqlite:///path/to/sessions.db.
+# Every worker that serves the app must point at the same store; for more than one machine
+# that means a shared volume. With METRICS_PORT set, each worker serves its own /metrics on
+# the first free port from METRICS_PORT up (see get_metrics_server in main.py)
+SESSION_STORE = os.environ.get("SESSION_STORE", os.path.join(CACHE_ROOT, "sessions"))
+ARTIFACT_ROOT = os.environ.get("ARTIFACT_DIR", os.path.join(CACHE_ROOT, "artifacts"))
+# Sessions (and their artifacts) untouched for this long are removed (seconds)
+SESSION_TTL = 7 * 24 * 60 * 60
+
+
+class FileSessionStore:
+    """One JSON file per session, replaced atomically on every save."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def load(self, session_id):
+        try:
+            with open(self._path(session_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, session_id, state):
+        path = self._path(session_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, session_id):
+        try:
+            os.remove(self._path(session_id))
+        except OSError:
+            pass
+
+    def expired(self, max_age):
+        cutoff = time.time() - max_age
+        session_ids = []
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                    session_ids.append(entry.name[:-len(".json")])
+            except OSError:
+                # Deleted by another worker's collection
+                continue
+        return session_ids
+
+
+class SQLiteSessionStore:
+    """Sessions as rows of one SQLite table (WAL mode, one connection per thread)."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit; busy_timeout lets concurrent writers from other processes wait their turn
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, session_id):
+        row = self._connect().execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, state):
+        self._connect().execute(
+            "INSERT INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (session_id, json.dumps(state, ensure_ascii=False), time.time())
+        )
+
+    def delete(self, session_id):
+        self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def expired(self, max_age):
+        rows = self._connect().execute("SELECT session_id FROM sessions WHERE updated_at < ?", (time.time() - max_age,))
+        return [row[0] for row in rows]
+
+
+def open_session_store(location=SESSION_STORE):
+    if location.startswith("sqlite:///"):
+        return SQLiteSessionStore(location[len("sqlite:///"):])
+    return FileSessionStore(location)
+
+
+class SessionArtifacts:
+    """Files produced for one session, named by the hash of their content.
+
+    Each session gets its own directory, so concurrent sessions never write
+    the same file, and writing the same content twice is a no-op.
+    """
+
+    def __init__(self, session_id, root=ARTIFACT_ROOT):
+        self.directory = os.path.join(root, session_id)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def write_text(self, text, suffix=".txt"):
+        path = os.path.join(self.directory, f"{hash_key(text)}{suffix}")
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        return path
+
+
+def collect_garbage(store, max_age=SESSION_TTL, root=ARTIFACT_ROOT):
+    """Remove sessions not saved for max_age seconds, with their artifacts.
+
+    Artifact directories are also removed when they are that old and have
+    no session (e.g. an upload abandoned before it was saved). Safe to run
+    from every worker at once. Returns the number of sessions removed.
+    """
+    removed = store.expired(max_age)
+    for session_id in removed:
+        store.delete(session_id)
+        shutil.rmtree(os.path.join(root, session_id), ignore_errors=True)
+
+    cutoff = time.time() - max_age
+    if os.path.isdir(root):
+        for entry in os.scandir(root):
+            try:
+                stale = entry.is_dir() and entry.stat().st_mtime < cutoff
+            except OSError:
+                continue
+            if stale and store.load(entry.name) is None:
+                shutil.rmtree(entry.path, ignore_errors=True)
+    return len(removed)
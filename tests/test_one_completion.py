@@ -0,0 +1,119 @@
+# tests/test_one_completion.py
+# Each question in the chat, with or without web context, and each "I need more
+# information" costs exactly one answer completion. The app runs under Streamlit's
+# AppTest with a counting fake LLM, fake embeddings and no Sarvam or Google calls.
+#
+# Usage: python -m pytest tests
+import os
+import sys
+import tempfile
+
+# Read at import time by disk_cache, session_store and api_keys
+os.environ["PRESCRIPTION_CACHE_DIR"] = tempfile.mkdtemp(prefix="prescription-test-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("SARVAM_API_KEY", "test")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import pytest
+import streamlit as st
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from streamlit.testing.v1 import AppTest
+
+import disk_cache
+import prescription_processing
+import rag_search
+import web_search
+from rag_search import PrescriptionIndex
+
+PRESCRIPTION_TEXT = "Paracetamol 500 mg tablet, one tablet every 6 hours after food for 3 days."
+HINDI_TEXT = "पैरासिटामोल 500 मिलीग्राम की गोली, 3 दिनों तक खाने के बाद हर 6 घंटे में एक गोली।"
+ANSWER = "Take one Paracetamol 500 mg tablet every 6 hours after food, for 3 days, as prescribed."
+
+# Prompts of every answer completion, in order
+completions = []
+
+
+class CountingChatModel(FakeListChatModel):
+    def _call(self, messages, *args, **kwargs):
+        completions.append(messages)
+        return super()._call(messages, *args, **kwargs)
+
+    def _stream(self, messages, *args, **kwargs):
+        completions.append(messages)
+        yield from super()._stream(messages, *args, **kwargs)
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    completions.clear()
+    # The answer cache lives on disk; a question cached by another test would cost no completion
+    monkeypatch.setattr(disk_cache, "CACHE_ROOT", str(tmp_path))
+    web_searches = []
+
+    def make_index(openai_api_key):
+        index = PrescriptionIndex(openai_api_key)
+        index.llm = CountingChatModel(responses=[ANSWER])
+        index.embeddings = DeterministicFakeEmbedding(size=16)
+        return index
+
+    monkeypatch.setattr(rag_search, "PrescriptionIndex", make_index)
+    monkeypatch.setattr(prescription_processing, "translate_to_hindi", lambda text, api_key: HINDI_TEXT)
+    monkeypatch.setattr(prescription_processing, "tts_available", lambda: True)
+    monkeypatch.setattr(prescription_processing, "text_to_speech_stream", lambda text, api_key, output_file=None: iter(()))
+
+    def fetch_web_info(query, *args, **kwargs):
+        web_searches.append(query)
+        return [{"text": "Paracetamol can rarely cause nausea or a skin rash.", "url": "https://example.com/paracetamol"}]
+
+    monkeypatch.setattr(web_search, "fetch_web_info", fetch_web_info)
+    # The index and answer cache are per-process resources; start each test with fresh ones
+    st.cache_resource.clear()
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, "main.py"), default_timeout=30)
+    at.run()
+    at.session_state["prescription_text"] = PRESCRIPTION_TEXT
+    at.session_state["hindi_text"] = HINDI_TEXT
+    at.session_state["audio_generated"] = False
+    at.web_searches = web_searches
+    yield at
+    st.cache_resource.clear()
+
+
+def ask(at, question):
+    at.chat_input[0].set_value(question).run()
+    assert not at.exception
+    return at
+
+
+def test_question_costs_one_completion(app):
+    ask(app, "How often should I take Paracetamol?")
+    assert len(completions) == 1
+    assert app.web_searches == []
+    assert app.session_state["messages"][-1] == {"role": "assistant", "content": ANSWER}
+
+
+def test_web_question_costs_one_completion(app):
+    ask(app, "What are the side effects of Paracetamol?")
+    assert len(completions) == 1
+    assert app.web_searches == ["What are the side effects of Paracetamol?"]
+
+
+def test_more_information_costs_one_completion(app):
+    ask(app, "How often should I take Paracetamol?")
+    more_information = next(button for button in app.button if button.label == "I need more information")
+    more_information.click().run()
+    assert not app.exception
+    # One for the question, one for the answer with web context; none served from the cache
+    assert len(completions) == 2
+    assert app.web_searches == ["How often should I take Paracetamol?"]
+    assert [message["role"] for message in app.session_state["messages"]] == ["user", "assistant", "user", "assistant"]
+
+
+def test_each_question_costs_one_completion(app):
+    questions = ["How often should I take Paracetamol?", "Should Paracetamol be taken after food?", "How many days is the course?"]
+    for question in questions:
+        ask(app, question)
+    assert len(completions) == len(questions)
@@ -0,0 +1,124 @@
+# tracing.py
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Id of the user request (upload or question) the current code is working for
+current_trace_id = contextvars.ContextVar("current_trace_id", default=None)
+
+# Most recent spans, process-wide
+MAX_SPANS = 10000
+_spans = deque(maxlen=MAX_SPANS)
+_spans_lock = threading.Lock()
+
+
+def start_trace():
+    trace_id = uuid.uuid4().hex
+    current_trace_id.set(trace_id)
+    return trace_id
+
+
+def in_current_trace(fn):
+    # Wrap a callable so it runs in this thread's context (trace id included) on a worker thread
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage and record it with its attributes.
+
+    Yields the attributes dict so the caller can add payload sizes or token
+    counts once they are known. Exceptions are recorded and re-raised.
+    """
+    start = time.perf_counter()
+    record = {"name": name, "trace_id": current_trace_id.get(), "start": time.time()}
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = repr(e)
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - start
+        record.update(attributes)
+        with _spans_lock:
+            _spans.append(record)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span %s", json.dumps(record, default=str))
+
+
+def get_spans(name=None):
+    with _spans_lock:
+        return [record for record in _spans if name is None or record["name"] == name]
+
+
+def spans_jsonl():
+    return "".join(json.dumps(record, default=str) + "\n" for record in get_spans())
+
+
+def export_jsonl(path):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(spans_jsonl())
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def stage_report():
+    durations = {}
+    for record in get_spans():
+        durations.setdefault(record["name"], []).append(record["duration"])
+    return {
+        name: {"count": len(values), "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95), "sum": sum(values)}
+        for name, values in sorted(durations.items())
+    }
+
+
+def format_stage_report():
+    lines = [f"{'stage':<20} {'count':>6} {'p50 (s)':>8} {'p95 (s)':>8}"]
+    for name, stats in stage_report().items():
+        lines.append(f"{name:<20} {stats['count']:>6} {stats['p50']:>8.3f} {stats['p95']:>8.3f}")
+    return "\n".join(lines)
+
+
+def prometheus_text():
+    lines = ["# TYPE stage_duration_seconds summary"]
+    for name, stats in stage_report().items():
+        lines.append(f'stage_duration_seconds{{stage="{name}",quantile="0.5"}} {stats["p50"]:.6f}')
+        lines.append(f'stage_duration_seconds{{stage="{name}",quantile="0.95"}} {stats["p95"]:.6f}')
+        lines.append(f'stage_duration_seconds_sum{{stage="{name}"}} {stats["sum"]:.6f}')
+        lines.append(f'stage_duration_seconds_count{{stage="{name}"}} {stats["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def start_metrics_server(port):
+    """Serve prometheus_text() at http://0.0.0.0:<port>/metrics from a daemon thread."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
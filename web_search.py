@@ -1,49 +1,342 @@
 # web_search.py
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-import requests
+import logging
+import math
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from bs4 import BeautifulSoup
+from disk_cache import DiskCache, hash_key
+from http_client import CircuitBreaker, ProviderClient, remaining_time, request_deadline
+from tracing import in_current_trace, span
+
+logger = logging.getLogger(__name__)
 
 # Path to the Service Account key JSON file
-SERVICE_ACCOUNT_FILE = "/users/manojjoshi/desktop/credentials/PP/prescriptionchatbot-051c305ca680.json"
+SERVICE_ACCOUNT_FILE = os.environ.get(
+    "GOOGLE_SERVICE_ACCOUNT_FILE", "/users/manojjoshi/desktop/credentials/PP/prescriptionchatbot-051c305ca680.json"
+)
 #SERVICE_ACCOUNT_FILE = "./prescriptionchatbot-e33dbe9a80cb.json"
 SEARCH_ENGINE_ID = "7642c5350181c4348"
+# Alternative discovery document (e.g. the local stand-in in benchmarks/fake_services.py); no credentials needed
+DISCOVERY_URL = os.environ.get("GOOGLE_DISCOVERY_URL")
 
 # Define the scopes
 SCOPES = ["https://www.googleapis.com/auth/cse"]
 
-# Authenticate using the Service Account
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES
+# Per-page timeout and the overall deadline for the search and the page fetches (seconds)
+PAGE_TIMEOUT = 5
+FETCH_DEADLINE = 6
+MAX_FETCH_WORKERS = 8
+# Send a second copy of a page request that is still running after this many seconds
+PAGE_HEDGE_AFTER = 2
+
+# Stop downloading a page after this many bytes; the useful text is almost always near the top
+MAX_PAGE_BYTES = 300 * 1024
+# Passage size and how many of the best passages per page go into the prompt
+PASSAGE_CHARS = 400
+TOP_PASSAGES = 3
+# How long search results and extracted pages are served without asking again (seconds)
+SEARCH_TTL = 24 * 60 * 60
+PAGE_TTL = 24 * 60 * 60
+
+# Normalized query -> result URLs, and URL -> extracted passages with ETag/Last-Modified
+search_cache = DiskCache("search_results", max_bytes=5 * 1024 * 1024)
+page_cache = DiskCache("pages", max_bytes=50 * 1024 * 1024)
+
+# Elements that are navigation, banners or code rather than article text
+BOILERPLATE_TAGS = ["script", "style", "noscript", "nav", "header", "footer", "aside", "form", "iframe", "svg", "button"]
+# Elements read as one block of text; links and other inline tags inside them stay in the block
+TEXT_BLOCK_TAGS = ["p", "li", "td", "th", "dt", "dd", "blockquote", "h1", "h2", "h3", "h4", "h5", "h6"]
+
+# Service account credentials and the one Custom Search client for the whole process
+# (both loaded on first search, not at import)
+_credentials = None
+_search_service = None
+_search_service_lock = threading.Lock()
+# The client's httplib2 transport is not thread-safe, so each request borrows a
+# connection from this pool instead (see search_http)
+_search_http_pool = queue.SimpleQueue()
+
+# Shared keep-alive connection pool for page downloads. Pages come from many unrelated
+# sites, so one bad site must not trip a breaker for all of them
+page_client = ProviderClient(
+    "pages", timeout=PAGE_TIMEOUT, max_retries=1, hedge_after=PAGE_HEDGE_AFTER,
+    pool_size=MAX_FETCH_WORKERS, failure_threshold=None, headers={"User-Agent": "Mozilla/5.0"}
 )
 
-def fetch_web_info(query, num_results=3):
-    results = []
+# Custom Search goes through googleapiclient (httplib2), which does its own jittered
+# retries on 429/5xx; only the breaker is shared
+search_breaker = CircuitBreaker("google_search")
+SEARCH_RETRIES = 2
+# Socket timeout for one Custom Search attempt; under a deadline, the attempts share what is left
+SEARCH_TIMEOUT = PAGE_TIMEOUT
+
+# Long-lived pool so slow pages can be abandoned without blocking the caller
+_fetch_executor = ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS, thread_name_prefix="web-fetch")
+
+
+def get_search_service():
+    global _credentials, _search_service
+    with _search_service_lock:
+        if _search_service is None:
+            # The Google client libraries are imported on first search, not at import
+            from googleapiclient.discovery import build
+            from google.oauth2 import service_account
+            if DISCOVERY_URL:
+                _search_service = build(
+                    "customsearch", "v1", discoveryServiceUrl=DISCOVERY_URL, static_discovery=False,
+                    developerKey="offline", cache_discovery=False
+                )
+            else:
+                # Authenticate using the Service Account
+                _credentials = service_account.Credentials.from_service_account_file(
+                    SERVICE_ACCOUNT_FILE, scopes=SCOPES
+                )
+                _search_service = build("customsearch", "v1", credentials=_credentials, cache_discovery=False)
+        return _search_service
+
+
+def search_timeout():
+    # httplib2 has no overall timeout, so each attempt (and retry) gets an equal share of the
+    # deadline; googleapiclient's backoff between attempts (under 3 s for two retries) comes on top
+    remaining = remaining_time()
+    if remaining is None:
+        return SEARCH_TIMEOUT
+    return max(0.1, min(SEARCH_TIMEOUT, remaining / (SEARCH_RETRIES + 1)))
+
+
+def _set_http_timeout(http, timeout):
+    # httplib2 applies its timeout when it opens a connection; pooled keep-alive
+    # connections are updated too
+    http.timeout = timeout
+    for connection in getattr(http, "http", http).connections.values():
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+
+@contextmanager
+def search_http(timeout=SEARCH_TIMEOUT):
+    # Transport for one Custom Search request (call get_search_service first);
+    # returned to the pool afterwards
+    try:
+        http = _search_http_pool.get_nowait()
+        _set_http_timeout(http, timeout)
+    except queue.Empty:
+        import httplib2
+        http = httplib2.Http(timeout=timeout)
+        if _credentials is not None:
+            import google_auth_httplib2
+            http = google_auth_httplib2.AuthorizedHttp(_credentials, http=http)
     try:
-        service = build("customsearch", "v1", credentials=credentials)
-        print(f"Searching for: {query}")
+        yield http
+    finally:
+        _search_http_pool.put(http)
+
+
+def _tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def split_passages(text, passage_chars=PASSAGE_CHARS):
+    # Merge the page's text blocks into passages of roughly passage_chars
+    passages = []
+    current = ""
+    for block in text.split("\n"):
+        block = " ".join(block.split())
+        if len(block) < 30:
+            # Menu items, buttons and other short fragments
+            continue
+        if current and len(current) + len(block) > passage_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current} {block}".strip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+def rank_passages(query, passages, top_n=TOP_PASSAGES, k1=1.5, b=0.75):
+    # Okapi BM25 over the page's own passages
+    if not passages:
+        return []
+    tokenized = [_tokenize(passage) for passage in passages]
+    avg_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1
+    document_frequency = Counter(term for tokens in tokenized for term in set(tokens))
+    query_terms = set(_tokenize(query))
+
+    def score(tokens):
+        term_counts = Counter(tokens)
+        total = 0.0
+        for term in query_terms:
+            if term not in term_counts:
+                continue
+            idf = math.log(1 + (len(passages) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            tf = term_counts[term]
+            total += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokens) / avg_length))
+        return total
+
+    scores = [score(tokens) for tokens in tokenized]
+    best = sorted(range(len(passages)), key=lambda i: scores[i], reverse=True)[:top_n]
+    # Keep the page's reading order for the passages we picked
+    return [passages[i] for i in sorted(best) if scores[i] > 0]
+
+
+def download_page(url, timeout=PAGE_TIMEOUT, max_bytes=MAX_PAGE_BYTES, headers=None):
+    # Returns (status_code, body bytes, response headers)
+    with page_client.get(url, timeout=timeout, stream=True, headers=headers) as response:
+        if response.status_code != 200:
+            return response.status_code, None, response.headers
+        content = bytearray()
+        for chunk in response.iter_content(chunk_size=16 * 1024):
+            content.extend(chunk)
+            if len(content) >= max_bytes:
+                break
+        # Raw bytes: the parser picks the charset up from the page itself
+        return response.status_code, bytes(content), response.headers
+
+
+def extract_page_passages(html):
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    # Outermost blocks only, so a <p> inside an <li> is not read twice. Joining the block's
+    # strings with spaces leaves one before punctuation that followed a tag ("<b>fever</b>.")
+    blocks = [
+        re.sub(r" ([.,;:!?)])", r"\1", " ".join(element.get_text(" ", strip=True).split()))
+        for element in soup.find_all(TEXT_BLOCK_TAGS)
+        if element.find_parent(TEXT_BLOCK_TAGS) is None
+    ]
+    if not blocks:
+        # Pages that keep their text directly in <div>s
+        return split_passages(soup.get_text(separator="\n"))
+    return split_passages("\n".join(blocks))
+
+
+def get_page_passages(url, timeout=PAGE_TIMEOUT):
+    # Passages are query-independent, so they are cached per URL and ranked per question
+    cache_key = hash_key(url)
+    entry = page_cache.get_json(cache_key)
+    if entry and time.time() - entry["stored_at"] < PAGE_TTL:
+        return entry["passages"]
+
+    # Stale or missing: revalidate with the validators we stored last time
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    status_code, html, response_headers = download_page(url, timeout=timeout, headers=headers)
+    logger.debug("Fetched %s: status %s, %d bytes", url, status_code, len(html or b""))
+
+    if status_code == 304 and entry:
+        passages = entry["passages"]
+    elif status_code == 200:
+        passages = extract_page_passages(html)
+    else:
+        return None
+    page_cache.set_timestamped_json(cache_key, {
+        "passages": passages,
+        "etag": response_headers.get("ETag") or (entry or {}).get("etag"),
+        "last_modified": response_headers.get("Last-Modified") or (entry or {}).get("last_modified"),
+    })
+    return passages
+
+
+def fetch_page_text(url, query, timeout=PAGE_TIMEOUT):
+    with span("page_fetch", url=url) as attributes:
+        passages = get_page_passages(url, timeout=timeout)
+        if passages is None:
+            return None
+        text = "\n\n".join(rank_passages(query, passages))
+        attributes["passages"] = len(passages)
+        attributes["output_chars"] = len(text)
+    return text
+
+
+def fetch_pages(urls, query, page_timeout=PAGE_TIMEOUT, deadline=FETCH_DEADLINE):
+    # Download all pages at once and keep whatever finished before the deadline,
+    # in the same order as the search results
+    # The deadline travels with each fetch, so retries and hedges stop when it passes
+    with request_deadline(deadline):
+        futures = {url: _fetch_executor.submit(in_current_trace(fetch_page_text), url, query, page_timeout) for url in urls}
+    done, not_done = wait(futures.values(), timeout=deadline)
+    for future in not_done:
+        future.cancel()
+
+    results = []
+    for url, future in futures.items():
+        if future not in done:
+            logger.warning("Deadline reached before %s finished", url)
+            continue
+        try:
+            text = future.result()
+        except Exception as e:
+            logger.warning("Error fetching %s: %s", url, e)
+            continue
+        if text:
+            results.append({"text": text, "url": url})
+    return results
+
+
+def normalize_query(query):
+    return " ".join(_tokenize(query))
+
+
+def search_urls(query, num_results=3):
+    cache_key = hash_key(normalize_query(query), str(num_results))
+    cached = search_cache.get_fresh_json(cache_key, SEARCH_TTL)
+    if cached is not None:
+        return cached["urls"]
+
+    service = get_search_service()
+    logger.debug("Searching for: %s", query)
+    with span("search", num_results=num_results) as attributes, search_breaker.guard(), search_http(search_timeout()) as http:
         res = service.cse().list(
             q=query,
             cx=SEARCH_ENGINE_ID,
             num=num_results,
-        ).execute()
-        
-        print(res)  # Debug: Print result
-
-        if "items" in res:
-            for item in res["items"]:
-                url = item["link"]
-                try:
-                    response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=5)
-                    if response.status_code == 200:
-                        soup = BeautifulSoup(response.text, "html.parser")
-                        text = soup.get_text(strip=True)[:5000]  # Truncate for brevity
-                        results.append({"text": text, "url": url})
-                except Exception as e:
-                    print(f"Error fetching {url}: {e}")
-        else:
-            print("No search results found.")
+        ).execute(http=http, num_retries=SEARCH_RETRIES)
+        attributes["items"] = len(res.get("items", []))
+
+    logger.debug("Search response: %s", res)
+
+    urls = [item["link"] for item in res.get("items", [])]
+    search_cache.set_timestamped_json(cache_key, {"urls": urls})
+    return urls
+
+
+def fetch_web_info(query, num_results=3, page_timeout=PAGE_TIMEOUT, deadline=FETCH_DEADLINE):
+    results = []
+    try:
+        # One deadline for the search and the page fetches together
+        with request_deadline(deadline):
+            urls = search_urls(query, num_results)
+            if urls:
+                results = fetch_pages(urls, query, page_timeout=page_timeout, deadline=max(0, remaining_time()))
+            else:
+                logger.info("No search results found for: %s", query)
     except Exception as e:
-        print(f"Error during Google Custom Search: {e}")
+        logger.warning("Error during Google Custom Search: %s", e)
+
+    return results if results else [{"text": "No additional information found on the web.", "url": "N/A"}]
+
+
+def warm_cache(queries, num_results=3):
+    # Pre-fill both cache levels, e.g. overnight with the most common drug questions
+    for query in queries:
+        fetch_web_info(query, num_results=num_results)
+    logger.info("Search cache: %s, page cache: %s", search_cache.stats(), page_cache.stats())
+
 
-    return results if results else [{"text": "No additional information found on the web.", "url": "N/A"}]
\ No newline at end of file
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # python web_search.py common_queries.txt  (one query per line)
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        warm_cache([line.strip() for line in f if line.strip()])